@@ -0,0 +1,130 @@
+"""
+    Array graph : CSR adjacency, with the weight and the state of every edge in NumPy arrays shared by all the nodes
+
+The nodes built by ArrayGraph.nodes run the usual protocol, but their edges are views on the arrays (ArrayEdge), so
+every state change made by the handlers is written in ArrayGraph.state. The whole graph can then be queried at once:
+lightest edge of every node, lightest outgoing edge of every fragment, number of edges in each state.
+"""
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+from items import EdgeState, Neighbour, Node, check_node_id
+from transport import HOST
+from utils import init_neighbours
+
+EDGE_STATES = {s.value: s for s in EdgeState}
+NO_EDGE = -1
+
+
+class ArrayGraph:
+    # Nodes are indexed 0..n-1 (ids[i] is the id of node i), edges 0..m-1
+    def __init__(self, edges):
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 3)
+
+        # Same graph as utils.build_graph: self-loops dropped, the first weight of a repeated edge kept
+        lo, hi = np.minimum(edges[:, 0], edges[:, 1]), np.maximum(edges[:, 0], edges[:, 1])
+        keep = np.nonzero(lo != hi)[0]
+        _, first = np.unique(np.stack([lo[keep], hi[keep]], axis=1), axis=0, return_index=True)
+        keep = keep[np.sort(first)]
+        m = len(keep)
+
+        self.ids, uv = np.unique(np.concatenate([lo[keep], hi[keep]]), return_inverse=True)
+        n = len(self.ids)
+        if n:
+            check_node_id(int(self.ids[0]))
+            check_node_id(int(self.ids[-1]))
+        self.u = uv[:m].astype(np.int32)  # Endpoints of each edge, u < v in id order
+        self.v = uv[m:].astype(np.int32)
+        self.weight = edges[keep, 2]
+        if m and -2 ** 31 <= self.weight.min() and self.weight.max() < 2 ** 31:
+            self.weight = self.weight.astype(np.int32)
+        else:
+            self.weight = self.weight.copy()
+        self.state = np.zeros(m, dtype=np.int8)  # EdgeState values
+
+        # Half-edges sorted by (node, weight, edge): each row starts with the lightest edge of the node
+        src = np.concatenate([self.u, self.v])
+        dst = np.concatenate([self.v, self.u])
+        edge = np.concatenate([np.arange(m, dtype=np.int32)] * 2)
+        order = np.lexsort((edge, self.weight[edge], src))
+        self.neighbour = dst[order]
+        self.edge = edge[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.indptr[1:])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.ids, self.u, self.v, self.weight, self.state, self.neighbour, self.edge,
+                                      self.indptr))
+
+    def nodes(self, transport=None) -> List[Node]:
+        # Nodes whose neighbours are in weight order and whose edges are views on the arrays
+        nodes = [Node(id, (HOST, 0), transport) for id in self.ids.tolist()]
+        edges = [ArrayEdge(self, e) for e in range(len(self.weight))]
+        neighbour, edge, indptr = self.neighbour.tolist(), self.edge.tolist(), self.indptr.tolist()
+        for i, n in enumerate(nodes):
+            init_neighbours(n, [Neighbour(edge=edges[edge[k]], node=nodes[neighbour[k]])
+                                for k in range(indptr[i], indptr[i + 1])])
+        return nodes
+
+    def least_weighted(self, state: EdgeState = EdgeState.BASIC) -> np.ndarray:
+        # For every node, its lightest edge in state, NO_EDGE if it has none. Rows are in weight order, so it is the
+        # first half-edge of the row in that state
+        allowed = np.nonzero(self.state[self.edge] == state.value)[0]
+        if len(allowed) == 0:
+            return np.full(len(self), NO_EDGE, dtype=np.int64)
+        first = np.minimum(np.searchsorted(allowed, self.indptr[:-1]), len(allowed) - 1)
+        position = allowed[first]
+        found = (position >= self.indptr[:-1]) & (position < self.indptr[1:])
+        return np.where(found, self.edge[position], NO_EDGE)
+
+    def fragment_mwoe(self, fragment: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # fragment gives the fragment of every node. Return the fragments that have an outgoing edge, and the
+        # lightest one of each (ties broken by edge index)
+        outgoing = np.nonzero(fragment[self.u] != fragment[self.v])[0]
+        outgoing = outgoing[np.lexsort((outgoing, self.weight[outgoing]))]
+        rank = np.arange(len(outgoing))
+        fragments = np.concatenate([fragment[self.u[outgoing]], fragment[self.v[outgoing]]])
+        order = np.lexsort((np.concatenate([rank, rank]), fragments))
+        fragments = fragments[order]
+        edges = np.concatenate([outgoing, outgoing])[order]
+        first = np.ones(len(fragments), dtype=bool)
+        first[1:] = fragments[1:] != fragments[:-1]
+        return fragments[first], edges[first]
+
+    def set_state(self, edges: np.ndarray, state: EdgeState):
+        self.state[edges] = state.value
+
+    def count_states(self) -> Dict[str, int]:
+        counts = np.bincount(self.state, minlength=len(EdgeState))
+        return {s.name: int(counts[s.value]) for s in EdgeState}
+
+    def member_edges(self) -> Set[Tuple[int, int]]:
+        # Same as mst.member_edges, from the arrays
+        members = np.nonzero(self.state == EdgeState.MEMBER.value)[0]
+        return set(zip(self.ids[self.u[members]].tolist(), self.ids[self.v[members]].tolist()))
+
+
+class ArrayEdge:
+    # Same interface as items.Edge, the weight and the state are stored in an ArrayGraph. Not a subclass: it would
+    # carry the two slots of Edge too, unused
+    __slots__ = ("graph", "index")
+
+    def __init__(self, graph: ArrayGraph, index: int):
+        self.graph = graph
+        self.index = index
+
+    @property
+    def weight(self) -> int:
+        return int(self.graph.weight[self.index])
+
+    @property
+    def state(self) -> EdgeState:
+        return EDGE_STATES[int(self.graph.state[self.index])]
+
+    @state.setter
+    def state(self, state: EdgeState):
+        self.graph.state[self.index] = state.value
@@ -0,0 +1,146 @@
+"""
+    asyncio engine : every node is a coroutine of a single event loop, no thread per node
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Set
+
+import metrics
+import recorder
+from framing import HEADER, encode_frame
+from items import Node, Message, MessageType
+from print_ts import INFO, log
+from script import dispatch_safely, handle, terminate_children
+from termination import Detector
+from transport import TcpTransport, Transport, directory
+from utils import bcolors, make_init_node
+
+
+class AsyncTransport(Transport):
+    # Messages sent by a node are written by the event loop
+    def __init__(self, async_node: "AsyncNode"):
+        self.async_node = async_node
+        self.inbox = async_node.inbox
+
+    def send(self, message: Message, node_dst: Node):
+        self.async_node.outgoing.put_nowait((node_dst, encode_frame(message.encode())))
+
+
+class AsyncNode:
+    # Inbox and streams of a node running on the event loop
+    def __init__(self, node: Node):
+        self.node = node
+        self.inbox = asyncio.Queue()  # (sender id, message) received, waiting to be handled
+        self.outgoing = asyncio.Queue()  # (destination, frame) sent, waiting to be written
+        self.writers: Dict[int, asyncio.StreamWriter] = {}
+        self.readers: Set[asyncio.Task] = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+        # The node sends through the event loop instead of its own sockets
+        node.transport = AsyncTransport(self)
+        directory.register(node.id, node.address)
+
+    async def serve(self):
+        self.server = await asyncio.start_server(self._read_stream, *directory.lookup(self.node.id))
+        directory.register(self.node.id, self.server.sockets[0].getsockname())
+
+    async def _read_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.readers.add(asyncio.current_task())
+        try:
+            while True:
+                (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+                message = Message.decode(await reader.readexactly(length))
+                self.inbox.put_nowait((message.sender, message))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # The sender closed the stream
+            writer.close()
+            self.readers.discard(asyncio.current_task())
+
+    async def write_streams(self):
+        while True:
+            batch = [await self.outgoing.get()]
+            while not self.outgoing.empty():
+                batch.append(self.outgoing.get_nowait())
+
+            # Everything queued for the same destination goes in one write
+            data: Dict[int, bytearray] = {}
+            for node_dst, frame in batch:
+                if node_dst.id not in self.writers:
+                    _, self.writers[node_dst.id] = await asyncio.open_connection(
+                        *directory.lookup(node_dst.id))
+                data.setdefault(node_dst.id, bytearray()).extend(frame)
+            for dst_id, frames in data.items():
+                self.writers[dst_id].write(frames)
+            for dst_id in data:
+                await self.writers[dst_id].drain()
+
+            for _ in batch:
+                self.outgoing.task_done()
+
+    async def run(self, nodes_by_id: Dict[int, Node], detector: Detector):
+        # Handle the messages until cancelled. A terminated node still empties its inbox, see script.process
+        node = self.node
+        dispatch = recorder.dispatcher(metrics.dispatcher(handle))
+        while True:
+            node_from_id, message = await self.inbox.get()
+            if not node.terminated:
+                dispatch_safely(dispatch, node, nodes_by_id[node_from_id], message)
+                if node.terminated:
+                    log(INFO, "protocol", bcolors.OKGREEN + "{}terminated" + bcolors.ENDC, node.id)
+                    terminate_children(node)
+                    detector.node_terminated()
+            detector.handled[node.id] += 1
+
+    async def close_writers(self):
+        for writer in self.writers.values():
+            writer.close()
+            await writer.wait_closed()
+
+    async def close(self):
+        # The readers end as soon as the senders closed their side
+        await asyncio.gather(*self.readers)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+async def run(nodes: List[Node], deadline: Optional[float] = None) -> dict:
+    # Run until all the nodes terminated, they are stuck or the deadline (s) is reached, see termination.py. Return
+    # why it stopped, the time to compute and the time to stop all the nodes
+    # Dummy node to send the INIT message to all the nodes to begin the algorithm
+    init_node = make_init_node(nodes, TcpTransport)
+    nodes_by_id = {n.id: n for n in nodes + [init_node]}
+
+    # The listeners of the nodes are replaced by asyncio servers
+    async_nodes = []
+    for node in nodes + [init_node]:
+        node.close()
+        async_nodes.append(AsyncNode(node))
+    if metrics.registry is not None:
+        metrics.registry.instrument(nodes)
+    if recorder.recorder is not None:
+        recorder.recorder.instrument(nodes + [init_node])
+    detector = Detector(len(nodes))
+    detector.instrument(nodes + [init_node])
+    start = time.perf_counter()
+    await asyncio.gather(*(a.serve() for a in async_nodes[:-1]))
+    writers = [asyncio.create_task(a.write_streams()) for a in async_nodes]
+
+    for node in nodes:
+        init_node.send(Message(MessageType.INIT, []), node)
+
+    runners = [asyncio.create_task(a.run(nodes_by_id, detector)) for a in async_nodes[:-1]]
+    reason = await detector.wait_async(deadline)
+    compute = time.perf_counter() - start
+
+    # Nothing is left to send once the run is over, the streams and the servers can be closed right away
+    start = time.perf_counter()
+    for task in runners + writers:
+        task.cancel()
+    await asyncio.gather(*runners, *writers, return_exceptions=True)
+    for a in async_nodes:
+        await a.close_writers()
+    for a in async_nodes:
+        await a.close()
+
+    return {"reason": reason, "compute_s": compute, "teardown_s": time.perf_counter() - start}
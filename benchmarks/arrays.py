@@ -0,0 +1,69 @@
+"""
+    Array graph benchmark : memory per edge and lightest-edge queries, Node/Edge objects vs arrays.ArrayGraph
+
+    python -m benchmarks.arrays --nodes 100000
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from arrays import ArrayGraph
+from graphs import sparse_random_graph
+from utils import build_graph, find_least_weighted_neighbour
+
+
+def measure(build):
+    # Return what build returns, and the memory it allocated
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    edges = sparse_random_graph(args.nodes, seed=args.seed)
+    m = len(edges)
+
+    nodes, objects_size = measure(lambda: build_graph(edges, None))
+    graph, _ = measure(lambda: ArrayGraph(edges))
+    # What --arrays runs: the nodes still hold their Neighbour objects, only the edges are views on the arrays
+    _, array_nodes_size = measure(lambda: ArrayGraph(edges).nodes(None))
+    print("{} nodes, {} edges".format(len(nodes), m))
+    print("objects:            {:.0f} bytes per edge".format(objects_size / m))
+    print("arrays alone:       {:.0f} bytes per edge".format(graph.nbytes() / m))
+    print("arrays + the nodes: {:.0f} bytes per edge".format(array_nodes_size / m))
+
+    # Lightest edge of every node
+    start = time.perf_counter()
+    lightest = [find_least_weighted_neighbour(n.neighbours).edge.weight for n in nodes]
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    vectorized = graph.least_weighted()
+    vector = time.perf_counter() - start
+    assert sorted(lightest) == sorted(graph.weight[vectorized].tolist())
+    print("lightest edge of every node: loop {:.3f} s, vectorized {:.3f} s".format(loop, vector))
+
+    # Lightest outgoing edge of every fragment, fragments of about 10 nodes
+    fragment = np.arange(len(graph)) // 10
+    start = time.perf_counter()
+    best = {}
+    for u, v, w in zip(graph.u.tolist(), graph.v.tolist(), graph.weight.tolist()):
+        fu, fv = fragment[u], fragment[v]
+        if fu != fv:
+            for f in (fu, fv):
+                if f not in best or w < best[f]:
+                    best[f] = w
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    fragments, mwoe = graph.fragment_mwoe(fragment)
+    vector = time.perf_counter() - start
+    assert dict(zip(fragments.tolist(), graph.weight[mwoe].tolist())) == best
+    print("lightest outgoing edge of every fragment: loop {:.3f} s, vectorized {:.3f} s".format(loop, vector))
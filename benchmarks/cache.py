@@ -0,0 +1,51 @@
+"""
+    Result cache benchmark : a stream of jobs on daemon.Cluster where the same graphs come back, for several cache sizes
+
+    python -m benchmarks.cache --nodes 100 --jobs 200 --graphs 20 --sizes 0,5,20
+
+The jobs draw their weights among --graphs weight sets, the first ones much more often (the i-th with a weight of
+1 / (i + 1)). Size 0 runs without cache. For each size: time per job, hits, misses and evictions, see cache.py, and
+the jobs that ended with every node terminated and the right tree. Only those are stored: as long as the protocol stops
+early on a graph, its jobs all miss and the time per job is the one without cache.
+"""
+import argparse
+import random
+import time
+
+import print_ts
+from benchmarks.daemon import weight_sets
+from cache import ResultCache
+from daemon import Cluster
+from graphs import sparse_random_graph
+from transport import TcpTransport
+from utils import build_graph
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--graphs", type=int, default=20)
+    parser.add_argument("--sizes", default="0,5,20", help="comma separated, trees kept in memory")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print_ts.configure(print_ts.WARNING)
+    edges = sparse_random_graph(args.nodes, seed=args.seed)
+    graphs = weight_sets(edges, args.graphs, args.seed)
+    rng = random.Random(args.seed)
+    stream = rng.choices(graphs, weights=[1 / (i + 1) for i in range(len(graphs))], k=args.jobs)
+
+    print("{:>5} {:>10} {:>6} {:>7} {:>10} {:>6}".format("size", "ms / job", "hits", "misses", "evictions", "whole"))
+    for size in [int(s) for s in args.sizes.split(",")]:
+        result_cache = ResultCache(capacity=size) if size > 0 else None
+        cluster = Cluster(build_graph(edges, TcpTransport), result_cache=result_cache)
+        start = time.perf_counter()
+        results = [cluster.result(cluster.submit(weights)) for weights in stream]
+        elapsed = time.perf_counter() - start
+        whole = sum(1 for r in results if r["reason"] in ("terminated", "cached") and r["mst_ok"])
+        cluster.close()
+
+        stats = result_cache.stats() if result_cache is not None else {"memory_hits": 0, "misses": 0, "evictions": 0}
+        print("{:>5} {:>10.1f} {:>6} {:>7} {:>10} {:>6}".format(size, elapsed / len(stream) * 1000,
+                                                                stats["memory_hits"], stats["misses"],
+                                                                stats["evictions"], whole))
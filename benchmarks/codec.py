@@ -0,0 +1,34 @@
+"""
+    Microbenchmark : encode/decode throughput of the binary Message codec against pickle
+"""
+import pickle
+import timeit
+
+from items import Message, MessageType
+
+
+def run(number: int = 200000):
+    message = Message(MessageType.REPORT, [], weight=42)
+    message.sender = 7
+    message.fragment = 3
+    message.level = 2
+
+    encoded = message.encode()
+    pickled = pickle.dumps(message)
+
+    results = [
+        ("pickle", len(pickled),
+         timeit.timeit(lambda: pickle.dumps(message), number=number),
+         timeit.timeit(lambda: pickle.loads(pickled), number=number)),
+        ("binary", len(encoded),
+         timeit.timeit(message.encode, number=number),
+         timeit.timeit(lambda: Message.decode(encoded), number=number)),
+    ]
+
+    print("{:<8}{:>8}{:>16}{:>16}".format("codec", "bytes", "encode msg/s", "decode msg/s"))
+    for name, size, t_enc, t_dec in results:
+        print("{:<8}{:>8}{:>16.0f}{:>16.0f}".format(name, size, number / t_enc, number / t_dec))
+
+
+if __name__ == "__main__":
+    run()
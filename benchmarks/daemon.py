@@ -0,0 +1,64 @@
+"""
+    Service mode benchmark : many small MST jobs on the resident nodes of daemon.Cluster, against one script.run each
+
+    python -m benchmarks.daemon --nodes 100 --jobs 20
+
+Each job draws new weights for the same topology. script.run builds and binds every node, runs and stops them for each
+job. The cluster runs them one after the other, then all at once.
+"""
+import argparse
+import collections
+import random
+import time
+
+import print_ts
+import script
+from daemon import Cluster
+from graphs import sparse_random_graph
+from transport import TcpTransport
+from utils import build_graph
+
+
+def weight_sets(edges, nb_jobs: int, seed: int):
+    rng = random.Random(seed)
+    return [[(u, v, rng.randint(1, 1000000)) for u, v, _ in edges] for _ in range(nb_jobs)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print_ts.configure(print_ts.WARNING)
+    edges = sparse_random_graph(args.nodes, seed=args.seed)
+    jobs = weight_sets(edges, args.jobs, args.seed)
+
+    start = time.perf_counter()
+    for weights in jobs:
+        script.run(build_graph(weights, TcpTransport), TcpTransport)
+    fresh = time.perf_counter() - start
+    print("script.run per job:     {:.1f} ms per job".format(fresh / len(jobs) * 1000))
+
+    start = time.perf_counter()
+    cluster = Cluster(build_graph(edges, TcpTransport))
+    print("cluster start:          {:.1f} ms, once".format((time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    for weights in jobs:
+        cluster.result(cluster.submit(weights))
+    sequential = time.perf_counter() - start
+    print("cluster, one at a time: {:.1f} ms per job".format(sequential / len(jobs) * 1000))
+
+    start = time.perf_counter()
+    ids = [cluster.submit(weights) for weights in jobs]
+    results = [cluster.result(job_id) for job_id in ids]
+    concurrent = time.perf_counter() - start
+    print("cluster, all at once:   {:.1f} ms per job, {} jobs in {:.3f} s".format(
+        concurrent / len(jobs) * 1000, len(jobs), concurrent))
+    print("                        ended: {}".format(dict(collections.Counter(r["reason"] for r in results))))
+
+    start = time.perf_counter()
+    cluster.close()
+    print("cluster stop:           {:.1f} ms, once".format((time.perf_counter() - start) * 1000))
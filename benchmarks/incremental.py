@@ -0,0 +1,84 @@
+"""
+    Incremental MST benchmark : repair the tree after random edge updates, against recomputing it from scratch
+
+    python -m benchmarks.incremental --nodes 100000 --updates 1000
+
+The nodes start with the MEMBER edges of the reference MST. Every update is an insertion, a deletion or a weight change
+of a random edge. After the batch, the repaired tree is compared with the reference MST of the new graph.
+"""
+import argparse
+import random
+import time
+
+from graphs import sparse_random_graph
+from incremental import IncrementalMst
+from items import EdgeState
+from mst import edges_from_nodes, member_edges, mst
+from utils import build_graph
+
+
+def random_updates(edges, nb_updates: int, seed: int):
+    rng = random.Random(seed)
+    n = max(max(u, v) for u, v, _ in edges)
+    present = {(min(u, v), max(u, v)) for u, v, _ in edges}
+    pairs = list(present)
+    updates = []
+    while len(updates) < nb_updates:
+        kind = rng.randrange(3)
+        if kind == 0:
+            u, v = rng.randint(1, n), rng.randint(1, n)
+            if u == v or (min(u, v), max(u, v)) in present:
+                continue
+            present.add((min(u, v), max(u, v)))
+            pairs.append((min(u, v), max(u, v)))
+            updates.append((u, v, rng.randint(1, 1000000)))
+        else:
+            index = rng.randrange(len(pairs))
+            u, v = pairs[index]
+            if (u, v) not in present:
+                continue
+            if kind == 1:
+                present.discard((u, v))
+                updates.append((u, v, None))
+            else:
+                updates.append((u, v, rng.randint(1, 1000000)))
+    return updates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    edges = sparse_random_graph(args.nodes, seed=args.seed)
+    nodes = build_graph(edges, None)
+    tree, _ = mst(edges)
+    for n in nodes:
+        for neigh in n.neighbours:
+            member = (min(n.id, neigh.node.id), max(n.id, neigh.node.id)) in tree
+            neigh.edge.state = EdgeState.MEMBER if member else EdgeState.NON_MEMBER
+
+    updates = random_updates(edges, args.updates, args.seed)
+    start = time.perf_counter()
+    maintained = IncrementalMst(nodes)
+    adopt = time.perf_counter() - start
+    start = time.perf_counter()
+    visited = maintained.apply(updates)
+    incremental = time.perf_counter() - start
+
+    new_edges = edges_from_nodes(nodes)
+    start = time.perf_counter()
+    expected, expected_weight = mst(new_edges)
+    full = time.perf_counter() - start
+
+    weights = {(u, v): w for u, v, w in new_edges}
+    found = member_edges(nodes)
+    ok = len(found) == len(expected) and sum(weights[e] for e in found) == expected_weight
+    print("{} nodes, {} edges, {} updates: tree {}".format(len(nodes), len(new_edges), len(updates),
+                                                          "OK" if ok else "WRONG"))
+    print("adopting the run state: {:.3f} s".format(adopt))
+    print("incremental: {:.1f} us per update, {:.0f} nodes read per update".format(
+        incremental / len(updates) * 1e6, visited / len(updates)))
+    print("from scratch: {:.3f} s per recomputation".format(full))
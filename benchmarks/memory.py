@@ -0,0 +1,37 @@
+"""
+    Memory benchmark : bytes per node and per edge of the graph built by utils.build_graph
+
+    python -m benchmarks.memory --nodes 100000
+"""
+import argparse
+import tracemalloc
+
+from graphs import sparse_random_graph
+from items import Node
+from transport import HOST
+from utils import build_graph
+
+
+def allocated(build) -> int:
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    edges = sparse_random_graph(args.nodes, seed=args.seed)
+
+    # Nodes without neighbours, then the whole graph: the difference is the cost of the edges
+    nodes_only = allocated(lambda: [Node(x, (HOST, 0)) for x in range(1, args.nodes + 1)])
+    graph = allocated(lambda: build_graph(edges, None))
+    print("{} nodes, {} edges, {:.1f} MB".format(args.nodes, len(edges), graph / 2 ** 20))
+    print("{:.0f} bytes per node, {:.0f} bytes per edge".format(nodes_only / args.nodes,
+                                                                (graph - nodes_only) / len(edges)))
@@ -0,0 +1,143 @@
+"""
+    Scaling benchmark : run the script.process pipeline end to end on synthetic graphs of growing size
+
+    python -m benchmarks.scaling --kinds sparse,grid,power-law --sizes 10,100,1000,10000 --output scaling.json
+
+Each run is done in its own process, so that the peak RSS is the one of that run only. The table (and the JSON file)
+gives, per graph: wall time, time to stop the nodes, how the run ended (see termination.py), whether the MEMBER edges
+are the MST, the number of messages per MessageType and the bytes sent.
+"""
+import argparse
+import collections
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import print_ts
+import script
+from framing import HEADER
+from graphs import GENERATORS
+from items import Message, MessageType, Node
+from mst import member_edges, mst
+from transport import InMemoryNetwork, TcpTransport, Transport, TransportWrapper
+from utils import build_graph
+
+
+class TrafficTransport(TransportWrapper):
+    # Count the messages and bytes sent through another transport
+    def __init__(self, inner: Transport):
+        super().__init__(inner)
+        self.messages = collections.Counter()
+        self.bytes = 0
+
+    def send(self, message: Message, node_dst: Node):
+        self.messages[message.message_type] += 1
+        self.bytes += HEADER.size + len(message.encode())
+        self.inner.send(message, node_dst)
+
+
+def run_one(kind: str, n: int, transport_name: str, deadline: float, seed: int) -> dict:
+    edges = GENERATORS[kind](n, seed=seed)
+    inner = TcpTransport if transport_name == "tcp" else InMemoryNetwork().transport
+
+    start = time.perf_counter()
+    nodes = build_graph(edges, lambda node: TrafficTransport(inner(node)))
+    load = time.perf_counter() - start
+
+    # The engine wraps the transports in its own
+    traffic = [nd_.transport for nd_ in nodes]
+    start = time.perf_counter()
+    termination = script.run(nodes, inner, deadline)
+    wall = time.perf_counter() - start
+
+    messages = collections.Counter()
+    for transport in traffic:
+        messages.update(transport.messages)
+
+    return {
+        "kind": kind,
+        "nodes": len(nodes),
+        "edges": len(edges),
+        "transport": transport_name,
+        "load_s": load,
+        "wall_s": wall,
+        "compute_s": termination["compute_s"],
+        "teardown_s": termination["teardown_s"],
+        "terminated": termination["reason"],
+        "mst_ok": member_edges(nodes) == mst(edges)[0],
+        "messages": {t.name: messages[t] for t in MessageType},
+        "bytes": sum(transport.bytes for transport in traffic),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_isolated(kind: str, n: int, args) -> dict:
+    # Run in a child process, the protocol logs go to /dev/null
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        path = f.name
+    try:
+        subprocess.run([sys.executable, "-m", "benchmarks.scaling", "--single", kind, str(n), path,
+                        "--transport", args.transport, "--deadline", str(args.deadline), "--seed", str(args.seed)],
+                       stdout=subprocess.DEVNULL, check=True)
+        with open(path) as f:
+            return json.load(f)
+    finally:
+        os.remove(path)
+
+
+def print_table(results):
+    types = [t.name for t in MessageType if any(r["messages"][t.name] for r in results)]
+    header = ["kind", "nodes", "edges", "wall s", "teardown s", "end", "mst", "messages", "bytes", "rss MB"] + types
+    rows = []
+    for r in results:
+        rows.append([r["kind"], r["nodes"], r["edges"], "{:.3f}".format(r["wall_s"]),
+                     "{:.4f}".format(r["teardown_s"]), r["terminated"], r["mst_ok"],
+                     sum(r["messages"].values()), r["bytes"], "{:.1f}".format(r["peak_rss_kb"] / 1024)]
+                    + [r["messages"][t] for t in types])
+    widths = [max(len(str(x)) for x in col) for col in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(str(x).rjust(w) for x, w in zip(row, widths)))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kinds", default="sparse,grid,power-law")
+    parser.add_argument("--sizes", default="10,100,1000,10000")
+    parser.add_argument("--transport", choices=["memory", "tcp"], default="memory")
+    parser.add_argument("--deadline", type=float, default=60, help="stop a run still going after this time (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON, to compare across commits")
+    parser.add_argument("--single", nargs=3, metavar=("KIND", "N", "RESULT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # Only the problems are logged, the protocol logs would be measured with the run
+        print_ts.configure(print_ts.WARNING)
+        kind, n, path = args.single
+        result = run_one(kind, int(n), args.transport, args.deadline, args.seed)
+        with open(path, "w") as f:
+            json.dump(result, f)
+        sys.exit()
+
+    results = []
+    for kind in args.kinds.split(","):
+        for n in [int(x) for x in args.sizes.split(",")]:
+            results.append(run_isolated(kind, n, args))
+            print("{} {} nodes: {:.3f} s".format(kind, n, results[-1]["wall_s"]), file=sys.stderr)
+
+    print_table(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"commit": git_commit(), "results": results}, f, indent=2)
@@ -0,0 +1,140 @@
+"""
+    Shared-memory ring vs socket benchmark : the two ways sharded workers can exchange messages on cut edges
+
+    python -m benchmarks.shm --messages 200000 --round-trips 20000
+
+Between two processes, measures the one-way throughput (messages/s) and the ping-pong round-trip latency of:
+    - tcp: loopback TCP stream, length-prefixed frames of destination id + Message.encode(), as TcpShardRouter
+    - shm: shm_ring.ShmRing records, as ShmShardRouter
+"""
+import argparse
+import multiprocessing
+import socket
+import statistics
+import time
+
+from framing import FrameDecoder, encode_frame
+from items import Message, MessageType
+from sharded import DESTINATION
+from shm_ring import ShmRing, wait_any
+
+
+def _message(i: int) -> Message:
+    message = Message(MessageType.REPORT, [], i)
+    message.sender = 7
+    message.fragment = 3
+    message.level = 2
+    return message
+
+
+def tcp_send(sock: socket.socket, dst_id: int, message: Message):
+    sock.sendall(encode_frame(DESTINATION.pack(dst_id) + message.encode()))
+
+
+def tcp_receive(sock: socket.socket, decoder: FrameDecoder, pending: list):
+    # Wait for at least one frame
+    while not pending:
+        data = sock.recv(65536)
+        if not data:
+            raise ConnectionError("peer closed")
+        for frame in decoder.feed(data):
+            (dst_id,) = DESTINATION.unpack_from(frame)
+            pending.append((dst_id, Message.decode(frame[DESTINATION.size:])))
+    return pending.pop(0)
+
+
+def tcp_peer(port: int, mode: str, count: int):
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    decoder, pending = FrameDecoder(), []
+    for _ in range(count):
+        dst_id, message = tcp_receive(sock, decoder, pending)
+        if mode == "ping-pong":
+            tcp_send(sock, dst_id, message)
+    if mode == "throughput":
+        sock.sendall(b"\0")  # Everything received
+    sock.close()
+
+
+def bench_tcp(mode: str, count: int) -> list:
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    peer = multiprocessing.Process(target=tcp_peer, args=(listener.getsockname()[1], mode, count))
+    peer.start()
+    sock, _ = listener.accept()
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    samples = []
+    decoder, pending = FrameDecoder(), []
+    start = time.perf_counter()
+    for i in range(count):
+        if mode == "ping-pong":
+            t = time.perf_counter()
+            tcp_send(sock, 1, _message(i))
+            tcp_receive(sock, decoder, pending)
+            samples.append(time.perf_counter() - t)
+        else:
+            tcp_send(sock, 1, _message(i))
+    if mode == "throughput":
+        sock.recv(1)
+        samples.append(time.perf_counter() - start)
+
+    peer.join()
+    sock.close()
+    listener.close()
+    return samples
+
+
+def shm_peer(ring_in: str, ring_out: str, mode: str, count: int):
+    rings_in, out = [ShmRing(ring_in)], ShmRing(ring_out)
+    received = 0
+    while received < count:
+        batch = wait_any(rings_in)
+        received += len(batch)
+        if mode == "ping-pong":
+            for dst_id, message in batch:
+                out.put(dst_id, message)
+    if mode == "throughput":
+        out.put(0, _message(0))  # Everything received
+    rings_in[0].close()
+    out.close()
+
+
+def bench_shm(mode: str, count: int) -> list:
+    out, back = ShmRing(), ShmRing()
+    peer = multiprocessing.Process(target=shm_peer, args=(out.name, back.name, mode, count))
+    peer.start()
+
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        if mode == "ping-pong":
+            t = time.perf_counter()
+            out.put(1, _message(i))
+            wait_any([back])
+            samples.append(time.perf_counter() - t)
+        else:
+            out.put(1, _message(i))
+    if mode == "throughput":
+        wait_any([back])
+        samples.append(time.perf_counter() - start)
+
+    peer.join()
+    out.close()
+    back.close()
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200000, help="one-way messages for the throughput")
+    parser.add_argument("--round-trips", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, bench in [("tcp", bench_tcp), ("shm", bench_shm)]:
+        elapsed = bench("throughput", args.messages)[0]
+        samples = sorted(bench("ping-pong", args.round_trips))
+        print("{}: {:>9.0f} messages/s one way, round trip median {:.1f} us, p99 {:.1f} us".format(
+            name, args.messages / elapsed, statistics.median(samples) * 1e6,
+            samples[int(len(samples) * 0.99)] * 1e6))
@@ -0,0 +1,130 @@
+"""
+    Edge testing benchmark : TEST/ACCEPT/REJECT messages with and without script.ORDERED_TESTING, on graphs of
+    growing density
+
+    python -m benchmarks.testing --nodes 1000 --degrees 4,16,64
+
+The runs use the round-based engine, so that both variants see the messages in the same order.
+
+A full run stops after its first phase for now (see the README), which only shows one TEST per node against one per
+edge. The second table runs every phase of the MWOE search: before each phase the fragments are set up from the edges
+chosen so far, each root starts the search with DOTEST through the handlers of script, and the MWOE found by each
+fragment is merged here, the CONNECT and MERGE messages are dropped. With ORDERED_TESTING, an edge found inside a
+fragment is NON_MEMBER for good and never tested again, the other variant tests all the BASIC edges at each phase.
+"""
+import argparse
+import collections
+from typing import Dict, List, Tuple
+
+import convergecast
+import metrics
+import print_ts
+import script
+import simulator
+from graphs import sparse_random_graph
+from items import EdgeState, Message, MessageType, edge_ends
+from mst import UnionFind, mst
+from utils import build_graph
+
+COUNTED = ["TEST", "ACCEPT", "REJECT"]
+
+
+def count_messages(edges, ordered: bool) -> dict:
+    script.ORDERED_TESTING = ordered
+    registry = metrics.enable()
+    simulator.run(build_graph(edges, None))
+    metrics.registry = None
+    return registry.totals().messages_out
+
+
+def set_fragments(nodes_by_id: Dict, tree: set, level: int) -> list:
+    # Fragments of the edges of tree, as the merges would have left them, each rooted at one of its nodes. Return the
+    # roots
+    uf = UnionFind()
+    adjacency = collections.defaultdict(list)
+    for u, v in tree:
+        uf.union(u, v)
+        adjacency[u].append(v)
+        adjacency[v].append(u)
+    roots = []
+    for node in nodes_by_id.values():
+        if uf.find(node.id) == node.id:
+            roots.append(node)
+    for root in roots:
+        root.parent = root.id
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            node.fragment = root.id
+            node.level = level
+            node.children = set()
+            for other in adjacency[node.id]:
+                node.neighbour_by_id[other].edge.state = EdgeState.MEMBER
+                if other != node.parent:
+                    node.children.add(other)
+                    nodes_by_id[other].parent = node.id
+                    stack.append(nodes_by_id[other])
+    return roots
+
+
+def search_phases(edges, ordered: bool) -> Tuple[List[collections.Counter], set]:
+    # Messages of each phase of the MWOE search until a single fragment is left, and the tree found
+    script.ORDERED_TESTING = ordered
+    sim = simulator.Simulator(build_graph(edges, None))
+    nodes_by_id = {nd_.id: nd_ for nd_ in sim.nodes}
+    script.nodes_by_id = nodes_by_id
+    tree = set()
+    phases = []
+    while True:
+        roots = set_fragments(nodes_by_id, tree, len(phases))
+        if len(roots) == 1:
+            return phases, tree
+        for root in roots:
+            script.handle(root, root, Message(MessageType.DOTEST, []))
+
+        counts = collections.Counter()
+        while sim.outgoing:
+            delivered, sim.outgoing = sim.outgoing, []
+            for dst_id, sender_id, message in delivered:
+                counts[message.message_type.name] += 1
+                if message.message_type not in (MessageType.MERGE, MessageType.CONNECT):
+                    script.handle(nodes_by_id[dst_id], script.nodes_by_id[sender_id], message)
+        phases.append(counts)
+
+        for root in roots:
+            (_, edge), _ = convergecast.result(root, script.MWOE)
+            tree.add(edge_ends(edge))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--degrees", default="4,16,64")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print_ts.configure(level=print_ts.WARNING)
+    print("{:>6} {:>8} {:>10} {:>8} {:>8} {:>8} {:>8}".format("degree", "edges", "testing", *COUNTED, "total"))
+    for degree in [float(d) for d in args.degrees.split(",")]:
+        edges = sparse_random_graph(args.nodes, degree=degree, seed=args.seed)
+        for ordered in (False, True):
+            counts = count_messages(edges, ordered)
+            print("{:>6g} {:>8} {:>10} {:>8} {:>8} {:>8} {:>8}".format(
+                degree, len(edges), "ordered" if ordered else "all", *[counts[name] for name in COUNTED],
+                sum(counts.values())))
+
+    print()
+    print("every phase of the MWOE search")
+    print("{:>6} {:>10} {:>7} {:>8} {:>8} {:>8}   {}".format("degree", "testing", "phases", *COUNTED,
+                                                            "TEST per phase"))
+    for degree in [float(d) for d in args.degrees.split(",")]:
+        edges = sparse_random_graph(args.nodes, degree=degree, seed=args.seed)
+        expected, _ = mst(edges)
+        for ordered in (False, True):
+            phases, tree = search_phases(edges, ordered)
+            if tree != expected:
+                print("the phases did not find the MST")
+            totals = sum(phases, collections.Counter())
+            print("{:>6g} {:>10} {:>7} {:>8} {:>8} {:>8}   {}".format(
+                degree, "ordered" if ordered else "all", len(phases), *[totals[name] for name in COUNTED],
+                ",".join(str(counts["TEST"]) for counts in phases)))
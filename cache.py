@@ -0,0 +1,124 @@
+"""
+    Result cache : the tree of a graph already computed, found again by a hash of the graph, without running GHS
+
+    python script.py --graph Neighbours_cours --cache .mst_cache
+
+The key is the SHA-256 of the sorted (u, v, weight) edge list, so the same graph gives the same key however its files
+are ordered. An entry holds the MEMBER edges and, per node, its parent, children, fragment, level and whether it
+terminated: on a hit, apply sets the edge states and the nodes as the run left them. The last entries used stay in
+memory (LRU), all of them in a directory when one is given, one JSON file per key. Only a run where every node
+terminated with the right tree is stored: a run stopped early (deadline, maximum number of rounds, or stuck as in
+simple_not_ending.txt) left a partial forest, that must not be served again.
+"""
+import collections
+import hashlib
+import json
+import os
+import struct
+import threading
+from typing import Dict, List, Optional
+
+from items import EdgeState, Node
+from mst import Edges, member_edges
+
+EDGE = struct.Struct("<IIq")
+
+
+def graph_key(edges: Edges) -> str:
+    digest = hashlib.sha256()
+    for u, v, w in sorted((min(u, v), max(u, v), w) for u, v, w in edges):
+        digest.update(EDGE.pack(u, v, w))
+    return digest.hexdigest()
+
+
+def capture(nodes: List[Node]) -> dict:
+    # What a run left in the nodes, as stored in the cache
+    return {"edges": sorted(member_edges(nodes)),
+            "nodes": {str(n.id): [n.parent, sorted(n.children), n.fragment, n.level, n.terminated] for n in nodes}}
+
+
+def apply(nodes: List[Node], result: dict):
+    # Set the nodes as the run of result left them. The edges out of the tree are NON_MEMBER, none is left to test
+    tree = {tuple(e) for e in result["edges"]}
+    for n in nodes:
+        for neigh in n.neighbours:
+            member = (min(n.id, neigh.node.id), max(n.id, neigh.node.id)) in tree
+            neigh.edge.state = EdgeState.MEMBER if member else EdgeState.NON_MEMBER
+        n.next_test = len(n.neighbours)
+        n.parent, children, n.fragment, n.level, n.terminated = result["nodes"][str(n.id)]
+        n.children = set(children)
+
+
+class ResultCache:
+    # capacity entries in memory. With a directory, at most disk_capacity files in it (None: no limit), the least
+    # recently used are removed first
+    def __init__(self, directory: Optional[str] = None, capacity: int = 64, disk_capacity: Optional[int] = None):
+        self.directory = directory
+        self.capacity = capacity
+        self.disk_capacity = disk_capacity
+        self.entries: Dict[str, dict] = collections.OrderedDict()
+        self.lock = threading.Lock()  # The jobs of daemon.Cluster end in their own threads
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key: str) -> Optional[dict]:
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+                return result
+
+            if self.directory is not None:
+                try:
+                    with open(self._path(key)) as file:
+                        result = json.load(file)
+                except (OSError, ValueError):
+                    result = None
+                if result is not None:
+                    os.utime(self._path(key))
+                    self.disk_hits += 1
+                    self._remember(key, result)
+                    return result
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, result: dict):
+        with self.lock:
+            self._remember(key, result)
+            if self.directory is None:
+                return
+            # Written aside then renamed, a reader never sees half a file
+            path = self._path(key)
+            with open(path + ".tmp", "w") as file:
+                json.dump(result, file)
+            os.replace(path + ".tmp", path)
+            if self.disk_capacity is not None:
+                self._trim_disk()
+
+    def _remember(self, key: str, result: dict):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _trim_disk(self):
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".json")]
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:max(0, len(paths) - self.disk_capacity)]:
+            os.remove(path)
+            self.disk_evictions += 1
+
+    def stats(self) -> dict:
+        return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "evictions": self.evictions, "disk_evictions": self.disk_evictions, "entries": len(self.entries)}
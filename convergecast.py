@@ -0,0 +1,96 @@
+"""
+    Broadcast / convergecast : one wave down the tree of a fragment and back up, combining the results on the way
+
+A Wave is a pair of MessageTypes. The node starting it sends the `down` one to each of its children (node.children),
+which start the wave in turn. Each node then waits for one `up` message per child and for its own local contributions,
+folds them with `combine`, and sends a single `up` message with the combined value to its parent (node.parent). At
+the root of the fragment, the handler gets the value of the whole tree and the neighbour it came from. A wave costs
+exactly one message per tree edge in each direction.
+
+    MWOE = Wave(MessageType.DOTEST, MessageType.REPORT, combine=min, identity=NO_EDGE, ...)
+    if convergecast.start(node, MWOE, local=1):   # the root has no child nor local contribution left
+        ...
+    if convergecast.contribute(node, MWOE, value, node):   # the root has all the values, see result
+        ...
+"""
+from typing import Any, Callable, List, Optional, Tuple
+
+from items import Message, MessageType, Node
+from utils import neighbour_from_id
+
+
+class Wave:
+    # Without combine, the wave only counts the answers, as NEW_FRAGMENT / ACK
+    def __init__(self, down: MessageType, up: MessageType, combine: Optional[Callable[[Any, Any], Any]] = None,
+                 identity: Any = None, to_message: Optional[Callable[[Any], Tuple[List, int]]] = None,
+                 from_message: Optional[Callable[[Message], Any]] = None):
+        self.down = down
+        self.up = up
+        self.combine = combine
+        self.identity = identity
+        # value -> (params, weight) of the up message, and back
+        self.to_message = to_message or (lambda value: ([], 0))
+        self.from_message = from_message or (lambda message: None)
+
+
+class WaveState:
+    # Where a node stands in a wave, in node.waves[wave.up]
+    __slots__ = ("pending", "value", "source")
+
+    def __init__(self, pending: int, value: Any):
+        self.pending = pending  # Answers still expected: children and local contributions, -1 once sent up
+        self.value = value  # Combined so far
+        self.source: Optional[Node] = None  # The child the value came from, or the node itself
+
+
+def start(node: Node, wave: Wave, local: int = 0) -> bool:
+    # Start the wave at node, expecting `local` contributions of its own. Return True if node is the root and the wave
+    # is already over
+    children = [neighbour_from_id(c_id, node) for c_id in node.children]
+    children = [child.node for child in children if child is not None]
+    node.waves[wave.up] = WaveState(len(children) + local, wave.identity)
+    for child in children:
+        node.send(Message(wave.down, []), child)
+    return _complete(node, wave)
+
+
+def contribute(node: Node, wave: Wave, value: Any, source: Node) -> bool:
+    # Fold one value, from source. Return True if node is the root and that was the last one
+    state = node.waves.get(wave.up)
+    if state is None or state.pending <= 0:
+        return False
+    if wave.combine is not None:
+        combined = wave.combine(state.value, value)
+        if combined is not state.value:
+            state.value = combined
+            state.source = source
+    state.pending -= 1
+    return _complete(node, wave)
+
+
+def receive(node: Node, wave: Wave, message: Message, node_from: Node) -> bool:
+    # The up message of a child
+    return contribute(node, wave, wave.from_message(message), node_from)
+
+
+def result(node: Node, wave: Wave) -> Tuple[Any, Optional[Node]]:
+    # The combined value of the subtree of node and where it came from, until the next start
+    state = node.waves[wave.up]
+    return state.value, state.source
+
+
+def pending(node: Node, wave: Wave) -> int:
+    state = node.waves.get(wave.up)
+    return state.pending if state is not None else 0
+
+
+def _complete(node: Node, wave: Wave) -> bool:
+    state = node.waves[wave.up]
+    if state.pending != 0:
+        return False
+    state.pending = -1
+    if node.parent == node.id:
+        return True
+    params, weight = wave.to_message(state.value)
+    node.send(Message(wave.up, params, weight), neighbour_from_id(node.parent, node).node)
+    return False
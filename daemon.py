@@ -0,0 +1,303 @@
+"""
+    Service mode : the nodes stay up between runs and run many MST jobs at once over the same topology
+
+    python daemon.py --graph Neighbours --port 8470
+    curl -X POST http://127.0.0.1:8470/jobs -d '{"weights": [[1, 2, 5]]}'
+    curl http://127.0.0.1:8470/jobs/1?wait=10
+
+Every node of the topology is resident: its listener, its outgoing streams and its threads are started once. A job
+has a whole set of Node objects of its own (fragment, level, edges...), built over the topology with the weights of the
+job, the ones it does not give are those of the topology. Each message carries the id of its job, and the thread of a
+resident node hands it to the Node of that job. The end of every job is detected on its own, see termination.py.
+With a ResultCache (--cache), a job whose graph was already run ends at once with the tree of that run, see cache.py.
+
+API, JSON on http://127.0.0.1:PORT:
+    POST /jobs {"weights": [[u, v, w], ...]}    submit a job, return its id
+    GET /jobs                                   id and status of every job
+    GET /jobs/ID[?wait=SECONDS]                 result and timing of a job, waiting at most SECONDS for it to end
+    DELETE /jobs/ID                             forget a job that ended
+    GET /cache                                  hit, miss and eviction counters of the cache
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import cache
+import print_ts
+from items import Message, MessageType, Node
+from mst import Edges, edges_from_nodes, member_edges, mst
+from print_ts import ERROR, INFO, log
+from script import handle, terminate_children
+from termination import Detector
+from transport import TcpTransport, Transport
+from utils import build_graph, make_init_node, read_graph
+
+
+class JobTransport(Transport):
+    # Transport of the Node of a job: the messages go through the transport of the resident node, tagged with the job
+    def __init__(self, resident: Node, job: int):
+        self.resident = resident
+        self.job = job
+
+    def send(self, message: Message, node_dst: Node):
+        message.job = self.job
+        self.resident.transport.send(message, node_dst)
+
+
+class Job:
+    def __init__(self, id: int, edges: Edges):
+        self.id = id
+        self.edges = edges
+        self.key = cache.graph_key(edges)
+        self.submitted = time.time()
+        self.nodes: List[Node] = []
+        self.nodes_by_id: Optional[Dict[int, Node]] = None  # Released once the job ended
+        self.detector: Optional[Detector] = None
+        self.setup = 0.0  # Time (s) to build the nodes of the job
+        self.started = 0.0
+        self.ended = threading.Event()
+        self.result: Optional[dict] = None
+
+    def status(self) -> dict:
+        if self.result is not None:
+            return self.result
+        return {"id": self.id, "status": "running", "submitted": self.submitted}
+
+
+class Cluster:
+    # The resident nodes, and the jobs they run
+    def __init__(self, topology: List[Node], deadline: Optional[float] = None,
+                 result_cache: Optional[cache.ResultCache] = None):
+        self.residents = {node.id: node for node in topology}
+        self.edges = edges_from_nodes(topology)
+        self.weights = {(u, v): w for u, v, w in self.edges}
+        self.deadline = deadline  # For each job, from its submission
+        self.jobs: Dict[int, Job] = {}
+        self.job_ids = itertools.count(1)
+        self.cache = result_cache
+
+        self.threads = []
+        for resident in topology:
+            resident.transport.on_failure(self._resident_failed)
+            resident.transport.start()
+            thread = threading.Thread(target=self._serve, args=(resident,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _resident_failed(self):
+        # A resident node stopped listening, the jobs running can not end anymore
+        for job in list(self.jobs.values()):
+            if job.detector is not None:
+                job.detector.finish("failed")
+
+    def _serve(self, resident: Node):
+        # Hand every message received by the resident node to the Node of its job
+        inbox = resident.transport.inbox
+        while True:
+            received = inbox.get()
+            if received is None:
+                return
+            sender_id, message = received
+            job = self.jobs.get(message.job)
+            nodes_by_id = job.nodes_by_id if job is not None else None
+            if nodes_by_id is None:
+                # Late message of a job that already ended
+                continue
+
+            node = nodes_by_id[resident.id]
+            if not node.terminated:
+                try:
+                    handle(node, nodes_by_id[sender_id], message)
+                except Exception:
+                    log(ERROR, "protocol", "Job {}: node {} failed to handle {}: {}", job.id, node.id,
+                        message.message_type, traceback.format_exc())
+                if node.terminated:
+                    terminate_children(node)
+                    job.detector.node_terminated()
+            job.detector.handled[node.id] += 1
+
+    def submit(self, weights: Edges = ()) -> int:
+        # Start a job over the topology, with the weights of the given (u, v, weight). Return its id. Raise ValueError,
+        # without using up a job id, if one of them is not an edge of the topology or not integers
+        weight_of = dict(self.weights)
+        for u, v, w in weights:
+            # The weight goes in a signed 64 bits field of the messages and of the cache key
+            if not all(type(x) is int for x in (u, v, w)) or not -(1 << 63) <= w < 1 << 63:
+                raise ValueError("({}, {}, {}): the ids and the weight must be integers, the weight on 64 bits"
+                                 .format(u, v, w))
+            edge = (min(u, v), max(u, v))
+            if edge not in weight_of:
+                raise ValueError("({}, {}) is not an edge of the topology".format(u, v))
+            weight_of[edge] = w
+
+        job = Job(next(self.job_ids), [(u, v, weight_of[(u, v)]) for u, v, _ in self.edges])
+        cached = self.cache.get(job.key) if self.cache is not None else None
+        if cached is not None:
+            self.jobs[job.id] = job
+            job.started = time.perf_counter()
+            self._finish(job, "cached", {tuple(e) for e in cached["edges"]})
+            return job.id
+
+        start = time.perf_counter()
+        job.nodes = build_graph(job.edges, lambda node: JobTransport(self.residents[node.id], job.id))
+        init_node = make_init_node(job.nodes)
+        job.detector = Detector(len(job.nodes))
+        job.detector.instrument(job.nodes)
+        job.detector.sent[init_node.id] = len(job.nodes)
+        job.detector.handled[init_node.id] = 0
+        job.setup = time.perf_counter() - start
+
+        job.started = time.perf_counter()
+        job.nodes_by_id = {node.id: node for node in job.nodes + [init_node]}
+        self.jobs[job.id] = job
+        for node in job.nodes:
+            message = Message(MessageType.INIT, [])
+            message.job = job.id
+            self.residents[node.id].transport.inbox.put((init_node.id, message))
+
+        threading.Thread(target=self._watch, args=(job,), daemon=True).start()
+        log(INFO, "protocol", "Job {} submitted", job.id)
+        return job.id
+
+    def _watch(self, job: Job):
+        reason = job.detector.wait(self.deadline)
+        result = cache.capture(job.nodes) if self.cache is not None and reason == "terminated" else None
+        self._finish(job, reason, member_edges(job.nodes))
+        # Only a whole and right tree, a job stopped early left a partial forest
+        if result is not None and job.result["mst_ok"]:
+            self.cache.put(job.key, result)
+
+    def _finish(self, job: Job, reason: str, found):
+        compute = time.perf_counter() - job.started
+        weights = {(u, v): w for u, v, w in job.edges}
+        expected, expected_weight = mst(job.edges)
+        found_weight = sum(weights[e] for e in found)
+        job.result = {
+            "id": job.id,
+            "status": "done",
+            "reason": reason,
+            "submitted": job.submitted,
+            "setup_s": job.setup,
+            "compute_s": compute,
+            "edges": sorted(found),
+            "weight": found_weight,
+            "mst_ok": len(found) == len(expected) and found_weight == expected_weight,
+        }
+        # The resident nodes drop the messages still coming for it
+        job.nodes_by_id = None
+        job.nodes = []
+        job.ended.set()
+        log(INFO, "protocol", "Job {} ended: {}", job.id, reason)
+
+    def result(self, job_id: int, timeout: Optional[float] = None) -> dict:
+        # Status of the job, or its result once ended. Wait at most timeout (s) for it to end
+        job = self.jobs[job_id]
+        job.ended.wait(timeout)
+        return job.status()
+
+    def forget(self, job_id: int):
+        if not self.jobs[job_id].ended.is_set():
+            raise ValueError("job {} is still running".format(job_id))
+        del self.jobs[job_id]
+
+    def close(self):
+        for resident in self.residents.values():
+            resident.transport.inbox.put(None)
+        for thread in self.threads:
+            thread.join()
+        for resident in self.residents.values():
+            resident.transport.stop()
+            resident.close()
+
+
+def serve(cluster: Cluster, port: int) -> ThreadingHTTPServer:
+    # Serve the API on http://127.0.0.1:port until shutdown() is called
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _job_id(self) -> Optional[int]:
+            parts = urlparse(self.path).path.strip("/").split("/")
+            if len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit() and int(parts[1]) in cluster.jobs:
+                return int(parts[1])
+            return None
+
+        def do_POST(self):
+            if urlparse(self.path).path.strip("/") != "jobs":
+                return self._reply(404, {"error": "not found"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not isinstance(body, dict) or not isinstance(body.get("weights", []), list):
+                    raise ValueError('the body must be {"weights": [[u, v, w], ...]}')
+                job_id = cluster.submit([tuple(e) for e in body.get("weights", [])])
+            except (ValueError, TypeError) as e:
+                return self._reply(400, {"error": str(e)})
+            self._reply(201, {"id": job_id})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.strip("/") == "cache":
+                return self._reply(200, cluster.cache.stats() if cluster.cache is not None else {})
+            if url.path.strip("/") == "jobs":
+                return self._reply(200, [{"id": job.id, "status": job.status()["status"]}
+                                         for job in list(cluster.jobs.values())])
+            job_id = self._job_id()
+            if job_id is None:
+                return self._reply(404, {"error": "no such job"})
+            wait = parse_qs(url.query).get("wait")
+            try:
+                timeout = float(wait[0]) if wait else 0
+            except ValueError:
+                return self._reply(400, {"error": "wait must be a number of seconds"})
+            self._reply(200, cluster.result(job_id, timeout))
+
+        def do_DELETE(self):
+            job_id = self._job_id()
+            if job_id is None:
+                return self._reply(404, {"error": "no such job"})
+            try:
+                cluster.forget(job_id)
+            except ValueError as e:
+                return self._reply(409, {"error": str(e)})
+            self._reply(200, {"id": job_id})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--graph", default="Neighbours_simple", help="topology, as for script.py")
+    parser.add_argument("--port", type=int, default=8470, help="port of the API, on 127.0.0.1")
+    parser.add_argument("--deadline", type=float, default=None, help="stop a job still running after this time (s)")
+    parser.add_argument("--cache", metavar="DIR", help="keep the trees of the jobs in DIR too, not only in memory")
+    parser.add_argument("--cache-size", type=int, default=64, help="trees kept in memory, 0 for no cache")
+    parser.add_argument("--log-level", choices=list(print_ts.LEVELS), default="info")
+    args = parser.parse_args()
+
+    print_ts.configure(print_ts.LEVELS[args.log_level])
+    result_cache = cache.ResultCache(args.cache, args.cache_size) if args.cache_size > 0 else None
+    cluster = Cluster(read_graph(args.graph, TcpTransport), args.deadline, result_cache)
+    server = serve(cluster, args.port)
+    print_ts.s_print("{} resident nodes, API on http://127.0.0.1:{}/jobs".format(len(cluster.residents), args.port))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    cluster.close()
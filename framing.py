@@ -0,0 +1,31 @@
+import struct
+from typing import List
+
+# Each frame is the length of the payload (4 bytes, network order) followed by the payload
+HEADER = struct.Struct("!I")
+
+
+def encode_frame(payload: bytes) -> bytes:
+    # Prefix the payload with its length
+    return HEADER.pack(len(payload)) + payload
+
+
+class FrameDecoder:
+    # Rebuild the frames of a stream, whatever the way the bytes were split by TCP
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        # Add the received bytes and return every frame now complete, in order
+        self.buffer += data
+        frames = []
+        start = 0
+        while len(self.buffer) - start >= HEADER.size:
+            (length,) = HEADER.unpack_from(self.buffer, start)
+            end = start + HEADER.size + length
+            if end > len(self.buffer):
+                break
+            frames.append(bytes(self.buffer[start + HEADER.size:end]))
+            start = end
+        del self.buffer[:start]
+        return frames
@@ -0,0 +1,77 @@
+"""
+    Synthetic graphs : random connected graphs with distinct weights, as (u, v, weight) edges for utils.build_graph
+"""
+import math
+import random
+from typing import List, Tuple
+
+Edges = List[Tuple[int, int, int]]
+
+
+def _with_weights(pairs, rng: random.Random) -> Edges:
+    # Distinct weights, so that the MST is unique
+    weights = rng.sample(range(1, 10 * len(pairs) + 1), len(pairs))
+    return [(u, v, w) for (u, v), w in zip(pairs, weights)]
+
+
+def sparse_random_graph(n: int, degree: float = 4, seed: int = 0) -> Edges:
+    # Random spanning tree, plus random edges up to an average degree of degree. Nodes are 1..n
+    rng = random.Random(seed)
+    pairs = set()
+    for x in range(2, n + 1):
+        y = rng.randint(1, x - 1)
+        pairs.add((y, x))
+
+    nb_edges = max(n - 1, int(n * degree / 2))
+    max_edges = n * (n - 1) // 2
+    while len(pairs) < min(nb_edges, max_edges):
+        u, v = rng.randint(1, n), rng.randint(1, n)
+        if u != v:
+            pairs.add((min(u, v), max(u, v)))
+
+    return _with_weights(sorted(pairs), rng)
+
+
+def grid_graph(n: int, seed: int = 0) -> Edges:
+    # Nearly square grid of n nodes
+    rng = random.Random(seed)
+    width = max(1, math.isqrt(n))
+    pairs = []
+    for x in range(1, n + 1):
+        if x % width != 0 and x + 1 <= n:
+            pairs.append((x, x + 1))
+        if x + width <= n:
+            pairs.append((x, x + width))
+    return _with_weights(pairs, rng)
+
+
+def power_law_graph(n: int, m: int = 2, seed: int = 0) -> Edges:
+    # Barabási–Albert preferential attachment: each new node is linked to m existing nodes, chosen with a
+    # probability proportional to their degree
+    rng = random.Random(seed)
+    pairs = set()
+    targets = []  # Each node appears once per incident edge
+    for x in range(2, n + 1):
+        chosen = {rng.choice(targets) for _ in range(m)} if targets else {1}
+        chosen.discard(x)
+        if not chosen:
+            chosen = {rng.randint(1, x - 1)}
+        for y in chosen:
+            pairs.add((y, x))
+            targets += [x, y]
+    return _with_weights(sorted(pairs), rng)
+
+
+GENERATORS = {
+    "sparse": sparse_random_graph,
+    "grid": grid_graph,
+    "power-law": power_law_graph,
+}
+
+
+def write_edge_list(edges: Edges, path: str):
+    # CSV edge list, readable by utils.read_edge_list
+    with open(path, "w") as file:
+        file.write("u,v,w\n")
+        for u, v, w in edges:
+            file.write("{},{},{}\n".format(u, v, w))
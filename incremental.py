@@ -0,0 +1,224 @@
+"""
+    Incremental MST : repair the tree of a finished run after edge insertions, deletions and weight changes
+
+The state of the run is used as is: MEMBER edges, parent/children and fragments. Each tree of MEMBER edges is a
+fragment, named after the id of its root. An update only walks the part of the tree it changes:
+    - a new or lighter edge between two nodes of the same fragment replaces the heaviest edge of the cycle it closes,
+      if it is lighter. Only the tree path between its endpoints is read
+    - a new edge between two fragments merges them, the smaller one is hung on the other
+    - a deleted or heavier tree edge splits its fragment. The lightest edge from the subtree below it back to the rest
+      of the fragment reconnects the two parts, only the edges of the subtree are read
+
+The nodes must have been built with plain Edge objects (utils.read_graph, utils.build_graph), not by arrays.ArrayGraph.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from items import Edge, EdgeState, Neighbour, Node
+
+Update = Tuple[int, int, Optional[int]]  # (u, v, weight), weight None deletes the edge
+
+
+def read_updates(path: str) -> List[Update]:
+    # One update per line, "u,v,w" to add an edge or change its weight, "u,v" to delete it. Comments and header are
+    # skipped, as in utils.read_edges
+    updates = []
+    with open(path) as file:
+        for line in file:
+            fields = [f.strip() for f in line.split("#")[0].split(",")]
+            if len(fields) < 2 or not fields[0].isdigit():
+                continue
+            weight = int(fields[2]) if len(fields) > 2 and fields[2] else None
+            updates.append((int(fields[0]), int(fields[1]), weight))
+    return updates
+
+
+class IncrementalMst:
+    def __init__(self, nodes: Iterable[Node]):
+        self.nodes_by_id: Dict[int, Node] = {n.id: n for n in nodes}
+        self.sizes: Dict[int, int] = {}  # Number of nodes of each fragment
+        self.visited = 0  # Nodes read by the updates, to compare with the size of the graph
+        self._adopt()
+
+    # Make parent/children/fragment agree with the MEMBER edges, a partial run may have left them apart. The root of a
+    # tree is kept when the run gave it one. Done once, in O(n)
+    def _adopt(self):
+        seen: Set[int] = set()
+        roots = [n for n in self.nodes_by_id.values() if n.parent == n.id]
+        others = [n for n in self.nodes_by_id.values() if n.parent != n.id]
+        for root in roots + others:
+            if root.id in seen:
+                continue
+            root.parent = root.id
+            tree = self._orient(root, seen)
+            self.sizes[root.id] = len(tree)
+
+    def _orient(self, root: Node, seen: Set[int]) -> List[Node]:
+        # Orient the MEMBER edges reachable from root away from it, and name the fragment after it
+        seen.add(root.id)
+        tree = [root]
+        for node in tree:
+            node.fragment = root.id
+            node.children = set()
+            for neigh in node.neighbours:
+                if neigh.edge.state == EdgeState.MEMBER and neigh.node.id not in seen:
+                    seen.add(neigh.node.id)
+                    neigh.node.parent = node.id
+                    node.children.add(neigh.node.id)
+                    tree.append(neigh.node)
+        return tree
+
+    def apply(self, updates: Iterable[Update]) -> int:
+        # Return the number of nodes read
+        visited = self.visited
+        for u, v, weight in updates:
+            if weight is None:
+                self.delete(u, v)
+            elif v in self.nodes_by_id[u].neighbour_by_id:
+                self.set_weight(u, v, weight)
+            else:
+                self.insert(u, v, weight)
+        return self.visited - visited
+
+    def insert(self, u: int, v: int, weight: int):
+        nu, nv = self.nodes_by_id[u], self.nodes_by_id[v]
+        if u == v or v in nu.neighbour_by_id:
+            raise ValueError("edge ({}, {}) cannot be added".format(u, v))
+
+        edge = Edge(weight)
+        edge.state = EdgeState.NON_MEMBER
+        nu.add_neighbour(Neighbour(edge=edge, node=nv))
+        nv.add_neighbour(Neighbour(edge=edge, node=nu))
+        self._offer(nu, nv, edge)
+
+    def delete(self, u: int, v: int):
+        nu, nv = self.nodes_by_id[u], self.nodes_by_id[v]
+        if v not in nu.neighbour_by_id:
+            raise ValueError("edge ({}, {}) does not exist".format(u, v))
+
+        edge = nu.neighbour_by_id[v].edge
+        if edge.state == EdgeState.MEMBER:
+            child = nu if nu.parent == v else nv
+            self._cut(child)
+            nu.remove_neighbour(v)
+            nv.remove_neighbour(u)
+            self._reconnect(child)
+        else:
+            nu.remove_neighbour(v)
+            nv.remove_neighbour(u)
+
+    def set_weight(self, u: int, v: int, weight: int):
+        nu, nv = self.nodes_by_id[u], self.nodes_by_id[v]
+        edge = nu.neighbour_by_id[v].edge
+        old_weight = edge.weight
+
+        # Same edge object, at its new place in both lists
+        neighbours = nu.remove_neighbour(v), nv.remove_neighbour(u)
+        edge.weight = weight
+        nu.add_neighbour(neighbours[0])
+        nv.add_neighbour(neighbours[1])
+
+        if edge.state == EdgeState.MEMBER and weight > old_weight:
+            # Another edge may now be lighter across the cut it makes
+            child = nu if nu.parent == v else nv
+            self._cut(child)
+            edge.state = EdgeState.NON_MEMBER
+            self._reconnect(child)
+        elif edge.state != EdgeState.MEMBER and weight < old_weight:
+            self._offer(nu, nv, edge)
+
+    # A non-tree edge between nu and nv: add it to the tree if it merges two fragments or is lighter than the
+    # heaviest edge of the cycle it closes
+    def _offer(self, nu: Node, nv: Node, edge: Edge):
+        if nu.fragment != nv.fragment:
+            small, big = (nu, nv) if self.sizes[nu.fragment] <= self.sizes[nv.fragment] else (nv, nu)
+            old_fragment = small.fragment
+            self._hang(small, big, edge)
+            tree = self._subtree(small)
+            for node in tree:
+                node.fragment = big.fragment
+            self.sizes[big.fragment] += self.sizes.pop(old_fragment)
+            return
+
+        path = self._path(nu, nv)
+        heaviest = max(path, key=lambda child: child.neighbour_by_id[child.parent].edge.weight)
+        heaviest_edge = heaviest.neighbour_by_id[heaviest.parent].edge
+        if edge.weight >= heaviest_edge.weight:
+            return
+
+        # heaviest is on the side of nu or of nv, that side is hung on the other through the new edge
+        self._cut(heaviest)
+        heaviest_edge.state = EdgeState.NON_MEMBER
+        below = nu if self._ancestors_until(nu, heaviest)[-1] is heaviest else nv
+        self._hang(below, nv if below is nu else nu, edge)
+
+    # Search the lightest edge from the subtree of child, already cut from its parent, to the rest of its fragment
+    def _reconnect(self, child: Node):
+        fragment = child.fragment
+        tree = self._subtree(child)
+        inside = {node.id for node in tree}
+        best: Optional[Tuple[int, Node, Neighbour]] = None
+        for node in tree:
+            # The neighbours are in weight order, the first one outside the subtree is the best of node
+            for neigh in node.neighbours:
+                if neigh.node.id not in inside and neigh.node.fragment == fragment:
+                    if best is None or neigh.edge.weight < best[0]:
+                        best = (neigh.edge.weight, node, neigh)
+                    break
+
+        if best is not None:
+            _, node, neigh = best
+            self._hang(node, neigh.node, neigh.edge)
+            return
+
+        # Nothing reconnects them: the subtree becomes a fragment of its own
+        for node in tree:
+            node.fragment = child.id
+        self.sizes[fragment] -= len(tree)
+        self.sizes[child.id] = len(tree)
+
+    def _cut(self, child: Node):
+        # Detach child and its subtree from its parent, child becomes their root
+        self.nodes_by_id[child.parent].children.discard(child.id)
+        child.parent = child.id
+
+    def _hang(self, node: Node, parent: Node, edge: Edge):
+        # Make node the root of its tree by reversing the path to the current root, then hang it under parent
+        path = self._ancestors_until(node, None)
+        for child, ancestor in zip(path, path[1:]):
+            ancestor.children.discard(child.id)
+            child.children.add(ancestor.id)
+            ancestor.parent = child.id
+        node.parent = parent.id
+        parent.children.add(node.id)
+        edge.state = EdgeState.MEMBER
+
+    def _ancestors_until(self, node: Node, last: Optional[Node]) -> List[Node]:
+        # node, its parent, ... up to last, or the root if last is None or not an ancestor
+        path = [node]
+        while path[-1] is not last and path[-1].parent != path[-1].id:
+            path.append(self.nodes_by_id[path[-1].parent])
+        self.visited += len(path)
+        return path
+
+    def _path(self, nu: Node, nv: Node) -> List[Node]:
+        # Tree path between two nodes of the same fragment, as the child end of each of its edges
+        ancestors = {node.id for node in self._ancestors_until(nu, None)}
+        path = []
+        node = nv
+        while node.id not in ancestors:
+            path.append(node)
+            node = self.nodes_by_id[node.parent]
+        common = node
+        node = nu
+        while node is not common:
+            path.append(node)
+            node = self.nodes_by_id[node.parent]
+        self.visited += len(path)
+        return path
+
+    def _subtree(self, root: Node) -> List[Node]:
+        tree = [root]
+        for node in tree:
+            tree.extend(self.nodes_by_id[id] for id in node.children)
+        self.visited += len(tree)
+        return tree
@@ -1,14 +1,34 @@
-import pickle
-import queue
-import sys
+import bisect
+import struct
 from enum import Enum
-from typing import List, Set
-import socket
+from typing import Callable, Dict, List, Optional, Set, Tuple, TYPE_CHECKING
 
-from print_ts import s_print
+from print_ts import DEBUG, ERROR, log
 
-PORT_IN = 12345
-PORT_OUT = 54321
+if TYPE_CHECKING:
+    from convergecast import WaveState
+    from transport import Transport
+
+
+# Largest node id of a graph. The messages carry node ids as u32 (the INIT node takes the largest id + 1), and an
+# edge id packs two of them in a param that must stay below 2**63: zigzag in Message.encode, "q" in shm_ring
+MAX_NODE_ID = (1 << 31) - 1
+
+
+# An edge as one int, (smallest id, largest id), to be carried in a message param
+def edge_id(u: int, v: int) -> int:
+    return (min(u, v) << 32) | max(u, v)
+
+
+def edge_ends(edge: int) -> Tuple[int, int]:
+    return edge >> 32, edge & 0xFFFFFFFF
+
+
+# Return id, raise ValueError if it is not a valid node id, see MAX_NODE_ID. Checked when a graph is loaded
+def check_node_id(id: int) -> int:
+    if not 0 <= id <= MAX_NODE_ID:
+        raise ValueError("node id {} out of range, the ids go from 0 to {}".format(id, MAX_NODE_ID))
+    return id
 
 
 class NodeState(Enum):
@@ -22,14 +42,73 @@ class EdgeState(Enum):
     NON_MEMBER = 2
 
 
+# Fixed part of an encoded message: type, job id, sender id, fragment id, level, weight
+MESSAGE_HEADER = struct.Struct("!BIIIIq")
+
+
 class Message:
-    def __init__(self, message_type: "MessageType", param: List):
+    __slots__ = ("message_type", "param", "weight", "job", "sender", "fragment", "level")
+
+    def __init__(self, message_type: "MessageType", param: List, weight: int = 0):
         self.message_type = message_type
         self.param = param
+        self.weight = weight
+        self.job = 0  # Run the message belongs to, several can share the nodes, see daemon.py
+        # Filled by the sender in Node.send
+        self.sender = 0
+        self.fragment = 0
+        self.level = 0
 
     def __str__(self):
         return "Message type" + str(self.message_type) + " with param(s) " + ",".join([str(x) for x in self.param])
 
+    def encode(self) -> bytes:
+        # Fixed-size header followed by the number of params and the params, as varints
+        data = bytearray(MESSAGE_HEADER.pack(self.message_type.value, self.job, self.sender, self.fragment,
+                                             self.level, self.weight))
+        _write_varint(data, len(self.param))
+        for p in self.param:
+            _write_varint(data, (p << 1) ^ (p >> 63))  # zigzag, so that negative params stay short
+        return bytes(data)
+
+    @staticmethod
+    def decode(data: bytes) -> "Message":
+        message_type, job, sender, fragment, level, weight = MESSAGE_HEADER.unpack_from(data)
+        pos = MESSAGE_HEADER.size
+        nb_param, pos = _read_varint(data, pos)
+        param = []
+        for _ in range(nb_param):
+            p, pos = _read_varint(data, pos)
+            param.append((p >> 1) ^ -(p & 1))
+
+        message = Message(MESSAGE_TYPES[message_type], param, weight)
+        message.job = job
+        message.sender = sender
+        message.fragment = fragment
+        message.level = level
+        return message
+
+
+def _write_varint(data: bytearray, value: int):
+    # 7 bits per byte, high bit set while more bytes follow
+    while value > 0x7F:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def _read_varint(data: bytes, pos: int):
+    # Return the value and the position of the next byte
+    value = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
 
 class MessageType(Enum):
     NEW_FRAGMENT = 0
@@ -45,78 +124,115 @@ class MessageType(Enum):
     INIT = 10
 
 
+# Decode a type byte without going through the Enum lookup
+MESSAGE_TYPES = {t.value: t for t in MessageType}
+
+
+Address = Tuple[str, int]  # (host, port), port 0 lets the OS pick a free port
+
+
 class Node:
+    # Every container is created per node in __init__. __slots__ so that a node has no __dict__
+    __slots__ = ("id", "fragment", "level", "address", "parent", "state", "neighbours", "neighbour_by_id",
+                 "terminated", "children", "received_connexion", "sent_connection", "accepted", "rejected",
+                 "waves", "count", "next_test", "transport")
+
     id: int  # Use only to print logs - No use in the algorithm
     fragment: int
-    address: str  # Address of this node
-    to_mwoe: "Node"
+    level: int  # Level of the fragment, incremented at each merge
+    address: Address  # Where this node listens, before the address map of transport.directory is applied
 
     parent: int  # Parent
-    state: NodeState = NodeState.OUT
-    neighbours: List["Neighbour"] = []  # Set of children
-    terminated: bool = False  # Use to stop the algorithm
-    children: Set["Neighbour"] = set()
-    received_connexion: Set[int] = set()
-    sent_connection: Set[int] = set()
-    accepted: List["Node"] = []
-    rejected: List["Node"] = []
-    min_weight: int = sys.maxsize
-    ack: int = 0
-    barrier: int = 0
-    count: int = 0
-    to_send = queue.Queue()
-    s: socket
-
-    def __init__(self, id, address):
+    state: NodeState
+    neighbours: List["Neighbour"]
+    neighbour_by_id: Dict[int, "Neighbour"]  # Index of neighbours, see set_neighbours
+    terminated: bool  # Use to stop the algorithm
+    children: Set[int]
+    received_connexion: Set[int]
+    sent_connection: Set[int]
+    accepted: List["Node"]
+    rejected: List["Node"]
+    waves: Dict["MessageType", "WaveState"]  # Broadcast / convergecast in progress, by up MessageType, see convergecast.py
+    count: int
+    next_test: int  # Index in neighbours of the next edge to test, see script.test_next
+    transport: "Transport"  # How the messages are sent and received, see transport.py
+
+    def __init__(self, id, address, transport: Optional[Callable[["Node"], "Transport"]] = None):
         # Add id and address to all nodes
         self.id = id
         self.address = address
         self.fragment = id
         self.parent = id
-
-        self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.s.bind((self.address, PORT_IN))
-
-        self.s.listen()
+        self.level = 0
+        self.state = NodeState.OUT
+        self.terminated = False
+        self.children = set()
+        self.received_connexion = set()
+        self.sent_connection = set()
+        self.accepted = []
+        self.rejected = []
+        self.waves = {}
+        self.count = 0
+        self.next_test = 0
+
+        # transport is a factory, e.g. TcpTransport or InMemoryNetwork.transport
+        self.transport = transport(self) if transport is not None else None
+
+        self.set_neighbours([])
 
     def __str__(self):
-        return str(self.__dict__)
-
-    def _send(self, message: Message, node_dst: "Node"):
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((self.address, PORT_OUT))
-
-        s.connect((node_dst.address, PORT_IN))
-        s.send(pickle.dumps(message))
-        s.close()
-        s_print("Node {} sent <{}> to node {}".format(self.id, message, node_dst.id))
+        return str({name: getattr(self, name) for name in Node.__slots__})
+
+    def set_neighbours(self, neighbours: List["Neighbour"]):
+        # Set the neighbours and build their index. The index holds the Neighbour objects themselves, so it stays
+        # valid when the state of their edge changes
+        self.neighbours = neighbours
+        self.neighbour_by_id = {neigh.node.id: neigh for neigh in neighbours}
+
+    def add_neighbour(self, neighbour: "Neighbour"):
+        # Insert at its place in weight order, the cursor of script.test_next keeps pointing to the same edge
+        index = bisect.bisect_right(self.neighbours, neighbour.edge.weight, key=lambda neigh: neigh.edge.weight)
+        self.neighbours.insert(index, neighbour)
+        self.neighbour_by_id[neighbour.node.id] = neighbour
+        if index < self.next_test:
+            self.next_test += 1
+
+    def remove_neighbour(self, id: int) -> "Neighbour":
+        neighbour = self.neighbour_by_id.pop(id)
+        index = self.neighbours.index(neighbour)
+        del self.neighbours[index]
+        if index < self.next_test:
+            self.next_test -= 1
+        return neighbour
 
     def send(self, message: Message, node_dst: "Node"):
+        # node_dst is the destination node itself, the transports only read its id
+        message.sender = self.id
+        message.fragment = self.fragment
+        message.level = self.level
         try:
-            if node_dst.id not in [neigh.node.id for neigh in self.neighbours] and len(
-                    self.neighbours) > 0 and node_dst.id != self.id:
-                s_print("FAIL !!!! {} try to send {} to {}".format(self.id, message.message_type, node_dst.id))
-            self._send(message, node_dst)
+            if node_dst.id not in self.neighbour_by_id and len(self.neighbours) > 0 and node_dst.id != self.id:
+                log(ERROR, "send", "FAIL !!!! {} try to send {} to {}", self.id, message.message_type, node_dst.id)
+            self.transport.send(message, node_dst)
+            log(DEBUG, "send", "Node {} sent <{}> to node {}", self.id, message, node_dst.id)
         except Exception:
-            s_print("EXEPTION !!!! {} try to send {} to None".format(self.id, message.message_type))
+            log(ERROR, "send", "EXEPTION !!!! {} try to send {} to None", self.id, message.message_type)
 
     def receive(self):
-        # Receive data
-        clientsocket, address = self.s.accept()
-        # Retrieve node source from ip
-        node_address = address[0]
+        # Wait for the next (sender id, message). Return None if interrupted
+        return self.transport.receive()
 
-        # Get message
-        message = pickle.loads(clientsocket.recv(4096))
+    def interrupt(self):
+        # Wake up the thread blocked in receive()
+        self.transport.interrupt()
 
-        clientsocket.close()
-
-        return node_address, message
+    def close(self):
+        self.transport.close()
 
 
 class Neighbour:
+    __slots__ = ("edge", "node")
+
     def __init__(self, edge, node):
         self.edge = edge
         self.node = node
@@ -130,6 +246,8 @@ class Neighbour:
 
 # This class represent a edge
 class Edge:
+    __slots__ = ("weight", "state")
+
     def __init__(self, weight):
         self.weight = weight
         self.state = EdgeState.BASIC
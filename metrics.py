@@ -0,0 +1,287 @@
+"""
+    Metrics : per node and per MessageType counters, handler time histograms, queue depth, time waiting on the REPORTs
+    and on the ACKs, and time spent at each fragment level
+
+Nothing is measured unless enable() was called: the engines then wrap the transports and the handler of the nodes,
+otherwise they run exactly as without this module. The result is dumped as JSON, and can be read as a Prometheus text
+snapshot over HTTP while the run is going (serve).
+"""
+import bisect
+import collections
+import functools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from framing import HEADER
+from items import Message, MessageType, Node
+from transport import Transport, TransportWrapper
+
+# Upper bounds (s) of the handler time buckets, the last bucket is +Inf
+BUCKETS = (1e-6, 4e-6, 16e-6, 64e-6, 256e-6, 1e-3, 4e-3, 16e-3, 64e-3)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def to_json(self) -> dict:
+        return {"buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], self.counts)), "sum": self.sum,
+                "count": self.count}
+
+
+class NodeMetrics:
+    def __init__(self, id: int):
+        self.id = id
+        # Per MessageType name
+        self.messages_in = collections.Counter()
+        self.bytes_in = collections.Counter()
+        self.messages_out = collections.Counter()
+        self.bytes_out = collections.Counter()
+        self.handler_time: Dict[str, Histogram] = collections.defaultdict(Histogram)
+
+        # Length of the inbox each time a message is taken out of it
+        self.queue_depth_max = 0
+        self.queue_depth_sum = 0
+        self.queue_depth_count = 0
+
+        self.barrier_wait = 0.0  # Time waiting on REPORTs or TEST answers in the MWOE search (s), see convergecast.py
+        self.ack_wait = 0.0  # Time waiting on ACKs after a NEW_FRAGMENT (s)
+        self.phase_time: Dict[int, float] = collections.defaultdict(float)  # Time spent at each fragment level (s)
+
+        # Start of the current wait / phase, None when not waiting
+        self.barrier_since: Optional[float] = None
+        self.ack_since: Optional[float] = None
+        self.level: Optional[int] = None
+        self.level_since = 0.0
+
+    def merge(self, other: "NodeMetrics"):
+        for mine, theirs in [(self.messages_in, other.messages_in), (self.bytes_in, other.bytes_in),
+                             (self.messages_out, other.messages_out), (self.bytes_out, other.bytes_out)]:
+            mine.update(theirs)
+        for name, histogram in other.handler_time.items():
+            self.handler_time[name].merge(histogram)
+        self.queue_depth_max = max(self.queue_depth_max, other.queue_depth_max)
+        self.queue_depth_sum += other.queue_depth_sum
+        self.queue_depth_count += other.queue_depth_count
+        self.barrier_wait += other.barrier_wait
+        self.ack_wait += other.ack_wait
+        for level, elapsed in other.phase_time.items():
+            self.phase_time[level] += elapsed
+
+    def to_json(self) -> dict:
+        return {
+            "messages_in": dict(self.messages_in),
+            "bytes_in": dict(self.bytes_in),
+            "messages_out": dict(self.messages_out),
+            "bytes_out": dict(self.bytes_out),
+            "handler_time": {name: h.to_json() for name, h in self.handler_time.items()},
+            "queue_depth": {"max": self.queue_depth_max,
+                            "mean": self.queue_depth_sum / self.queue_depth_count if self.queue_depth_count else 0},
+            "barrier_wait_s": self.barrier_wait,
+            "ack_wait_s": self.ack_wait,
+            "phase_time_s": {str(level): elapsed for level, elapsed in sorted(self.phase_time.items())},
+        }
+
+    def __getstate__(self):
+        # Sent back by the sharded workers, the defaultdicts are rebuilt on the other side
+        state = self.__dict__.copy()
+        state["handler_time"] = dict(self.handler_time)
+        state["phase_time"] = dict(self.phase_time)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.handler_time = collections.defaultdict(Histogram, self.handler_time)
+        self.phase_time = collections.defaultdict(float, self.phase_time)
+
+
+def _size(message: Message) -> int:
+    return HEADER.size + len(message.encode())
+
+
+def _waiting(node: Node, up: MessageType) -> bool:
+    # node waits for answers in the wave whose answers are up, see convergecast.py
+    state = node.waves.get(up)
+    return state is not None and state.pending > 0
+
+
+class MeteredTransport(TransportWrapper):
+    # Count the messages and bytes sent through another transport
+    def __init__(self, inner: Transport, metrics: NodeMetrics):
+        super().__init__(inner)
+        self.metrics = metrics
+
+    def send(self, message: Message, node_dst: Node):
+        name = message.message_type.name
+        self.metrics.messages_out[name] += 1
+        self.metrics.bytes_out[name] += _size(message)
+        self.inner.send(message, node_dst)
+
+
+class Registry:
+    def __init__(self):
+        self.nodes: Dict[int, NodeMetrics] = {}
+        self.start = time.perf_counter()
+
+    def instrument(self, nodes: List[Node]):
+        # Count what the nodes send. Their handler is wrapped by the engines, see handle
+        for node in nodes:
+            metrics = self.nodes.setdefault(node.id, NodeMetrics(node.id))
+            node.transport = MeteredTransport(node.transport, metrics)
+
+    def handle(self, handler, node: Node, node_from: Node, message: Message):
+        # Call handler(node, node_from, message) and measure it
+        metrics = self.nodes[node.id]
+        name = message.message_type.name
+        metrics.messages_in[name] += 1
+        metrics.bytes_in[name] += _size(message)
+        inbox = getattr(node.transport, "inbox", None)
+        if inbox is not None:
+            depth = inbox.qsize()
+            metrics.queue_depth_max = max(metrics.queue_depth_max, depth)
+            metrics.queue_depth_sum += depth
+            metrics.queue_depth_count += 1
+
+        start = time.perf_counter()
+        if metrics.level != node.level:
+            self._end_phase(metrics, start)
+            metrics.level = node.level
+        if metrics.barrier_since is None and _waiting(node, MessageType.REPORT):
+            metrics.barrier_since = start
+        if metrics.ack_since is None and _waiting(node, MessageType.ACK):
+            metrics.ack_since = start
+
+        handler(node, node_from, message)
+
+        end = time.perf_counter()
+        metrics.handler_time[name].observe(end - start)
+        if metrics.barrier_since is not None and not _waiting(node, MessageType.REPORT):
+            metrics.barrier_wait += end - metrics.barrier_since
+            metrics.barrier_since = None
+        elif metrics.barrier_since is None and _waiting(node, MessageType.REPORT):
+            metrics.barrier_since = end
+        if metrics.ack_since is not None and not _waiting(node, MessageType.ACK):
+            metrics.ack_wait += end - metrics.ack_since
+            metrics.ack_since = None
+        elif metrics.ack_since is None and _waiting(node, MessageType.ACK):
+            metrics.ack_since = end
+        if node.terminated:
+            self._end_phase(metrics, end)
+            metrics.level = None
+
+    @staticmethod
+    def _end_phase(metrics: NodeMetrics, now: float):
+        if metrics.level is not None:
+            metrics.phase_time[metrics.level] += now - metrics.level_since
+        metrics.level_since = now
+
+    def merge(self, nodes: Dict[int, NodeMetrics]):
+        # Add the metrics measured in another process
+        for id, metrics in nodes.items():
+            self.nodes.setdefault(id, NodeMetrics(id)).merge(metrics)
+
+    def totals(self) -> NodeMetrics:
+        total = NodeMetrics(0)
+        for metrics in list(self.nodes.values()):
+            total.merge(metrics)
+        return total
+
+    def to_json(self) -> dict:
+        return {
+            "elapsed_s": time.perf_counter() - self.start,
+            "total": self.totals().to_json(),
+            "nodes": {str(id): metrics.to_json() for id, metrics in sorted(self.nodes.items())},
+        }
+
+    def dump(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.to_json(), file, indent=2)
+
+    def prometheus(self) -> str:
+        # Text exposition format, per node and MessageType
+        lines = []
+        counters = [("ghs_messages_in_total", "messages_in"), ("ghs_bytes_in_total", "bytes_in"),
+                    ("ghs_messages_out_total", "messages_out"), ("ghs_bytes_out_total", "bytes_out")]
+        nodes = sorted(self.nodes.items())
+        for metric, attribute in counters:
+            lines.append("# TYPE {} counter".format(metric))
+            for id, metrics in nodes:
+                for name, value in dict.copy(getattr(metrics, attribute)).items():
+                    lines.append('{}{{node="{}",type="{}"}} {}'.format(metric, id, name, value))
+
+        lines.append("# TYPE ghs_handler_seconds histogram")
+        for id, metrics in nodes:
+            for name, histogram in dict.copy(metrics.handler_time).items():
+                labels = 'node="{}",type="{}"'.format(id, name)
+                cumulated = 0
+                for bound, count in zip([str(b) for b in BUCKETS] + ["+Inf"], list(histogram.counts)):
+                    cumulated += count
+                    lines.append('ghs_handler_seconds_bucket{{{},le="{}"}} {}'.format(labels, bound, cumulated))
+                lines.append("ghs_handler_seconds_sum{{{}}} {}".format(labels, histogram.sum))
+                lines.append("ghs_handler_seconds_count{{{}}} {}".format(labels, histogram.count))
+
+        gauges = [("ghs_queue_depth_max", lambda m: m.queue_depth_max),
+                  ("ghs_barrier_wait_seconds", lambda m: m.barrier_wait),
+                  ("ghs_ack_wait_seconds", lambda m: m.ack_wait)]
+        for metric, value in gauges:
+            lines.append("# TYPE {} gauge".format(metric))
+            for id, metrics in nodes:
+                lines.append('{}{{node="{}"}} {}'.format(metric, id, value(metrics)))
+
+        lines.append("# TYPE ghs_phase_seconds gauge")
+        for id, metrics in nodes:
+            for level, elapsed in dict.copy(metrics.phase_time).items():
+                lines.append('ghs_phase_seconds{{node="{}",level="{}"}} {}'.format(id, level, elapsed))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        # Serve the Prometheus snapshot on http://127.0.0.1:port/metrics until shutdown() is called
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+registry: Optional[Registry] = None
+
+
+def dispatcher(handler):
+    # handler itself when the metrics are off, otherwise handler measured by the registry
+    if registry is None:
+        return handler
+    return functools.partial(registry.handle, handler)
+
+
+def enable() -> Registry:
+    # Measure the next runs of all the engines
+    global registry
+    registry = Registry()
+    return registry
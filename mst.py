@@ -0,0 +1,174 @@
+"""
+    Reference MST : centralized Kruskal / Borůvka, to validate a distributed run and as a baseline
+"""
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+
+from items import EdgeState, Node
+from print_ts import s_print
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SHOWN_EDGES = 20  # Missing and extra edges printed by check at most
+BORUVKA_THRESHOLD = 10000  # From this number of edges, use the NumPy Borůvka when NumPy is available
+
+Edges = List[Tuple[int, int, int]]  # (u, v, weight)
+
+
+class UnionFind:
+    # Disjoint sets with path compression and union by size
+    def __init__(self):
+        self.parent: Dict[int, int] = {}
+        self.size: Dict[int, int] = {}
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        if x not in parent:
+            parent[x] = x
+            self.size[x] = 1
+            return x
+
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        # Path compression
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, x: int, y: int) -> bool:
+        # Merge the sets of x and y. Return False if they were already the same
+        x, y = self.find(x), self.find(y)
+        if x == y:
+            return False
+        if self.size[x] < self.size[y]:
+            x, y = y, x
+        self.parent[y] = x
+        self.size[x] += self.size[y]
+        return True
+
+
+# Every edge of the graph once, as (u, v, weight) with u < v
+def edges_from_nodes(nodes: Iterable[Node]) -> Edges:
+    edges = []
+    for n in nodes:
+        for neigh in n.neighbours:
+            if n.id < neigh.node.id:
+                edges.append((n.id, neigh.node.id, neigh.edge.weight))
+    return edges
+
+
+def kruskal(edges: Edges) -> Tuple[Set[Tuple[int, int]], int]:
+    # Return the MST (minimum spanning forest if not connected) edges as (min id, max id) and its weight
+    uf = UnionFind()
+    tree = set()
+    total = 0
+    for u, v, w in sorted(edges, key=lambda e: e[2]):
+        if uf.union(u, v):
+            tree.add((min(u, v), max(u, v)))
+            total += w
+    return tree, total
+
+
+def boruvka(edges) -> Tuple[Set[Tuple[int, int]], int]:
+    # Vectorized Borůvka on a (E, 3) array or list of (u, v, weight). Same result as kruskal
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 3)
+    if len(edges) == 0:
+        return set(), 0
+
+    # Remap the ids on 0..n-1, and rank the edges by (weight, index) so that ties are broken the same everywhere
+    ids, uv = np.unique(edges[:, :2], return_inverse=True)
+    uv = uv.reshape(-1, 2)
+    u, v, w = uv[:, 0], uv[:, 1], edges[:, 2]
+    order = np.argsort(w, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    n = len(ids)
+    nb_edges = len(edges)
+    comp = np.arange(n)
+    selected = np.zeros(nb_edges, dtype=bool)
+    while True:
+        cu, cv = comp[u], comp[v]
+        outgoing = np.nonzero(cu != cv)[0]
+        if len(outgoing) == 0:
+            break
+
+        # Minimum-weight outgoing edge of each component
+        best = np.full(n, nb_edges, dtype=np.int64)
+        np.minimum.at(best, cu[outgoing], rank[outgoing])
+        np.minimum.at(best, cv[outgoing], rank[outgoing])
+        has_edge = np.nonzero(best < nb_edges)[0]
+        chosen = order[best[has_edge]]
+        selected[chosen] = True
+
+        # Hook each component on the other end of its edge. Two components that chose the same edge point to each
+        # other, the smaller one becomes the root
+        idx = np.arange(n)
+        target = idx.copy()
+        target[has_edge] = np.where(cu[chosen] == has_edge, cv[chosen], cu[chosen])
+        mutual = (target[target] == idx) & (idx < target)
+        target[mutual] = idx[mutual]
+
+        # Pointer jumping until every component points to its root
+        while True:
+            jumped = target[target]
+            if np.array_equal(jumped, target):
+                break
+            target = jumped
+        comp = target[comp]
+
+    tree_idx = np.nonzero(selected)[0]
+    a, b = ids[u[tree_idx]], ids[v[tree_idx]]
+    tree = set(zip(np.minimum(a, b).tolist(), np.maximum(a, b).tolist()))
+    return tree, int(w[tree_idx].sum())
+
+
+def mst(graph) -> Tuple[Set[Tuple[int, int]], int]:
+    # graph is either the nodes built by utils.read_graph, or (u, v, weight) edges
+    if isinstance(graph, list) and graph and isinstance(graph[0], Node):
+        graph = edges_from_nodes(graph)
+    if np is not None and len(graph) >= BORUVKA_THRESHOLD:
+        return boruvka(graph)
+    return kruskal(list(map(tuple, graph)))
+
+
+# Edges in the MEMBER state at the end of a distributed run, as (min id, max id)
+def member_edges(nodes: Iterable[Node]) -> Set[Tuple[int, int]]:
+    tree = set()
+    for n in nodes:
+        for neigh in n.neighbours:
+            if neigh.edge.state == EdgeState.MEMBER:
+                tree.add((min(n.id, neigh.node.id), max(n.id, neigh.node.id)))
+    return tree
+
+
+def check(nodes: List[Node]) -> bool:
+    # Compare the MEMBER edges of a distributed run with the reference MST. Print the differences
+    start = time.perf_counter()
+    expected, expected_weight = mst(nodes)
+    elapsed = time.perf_counter() - start
+    found = member_edges(nodes)
+    weights = {(min(u, v), max(u, v)): w for u, v, w in edges_from_nodes(nodes)}
+    found_weight = sum(weights[e] for e in found)
+
+    # With equal weights several trees are minimal, any of them is right
+    ok = found == expected or (len(found) == len(expected) and found_weight == expected_weight
+                               and len(kruskal([(u, v, weights[(u, v)]) for u, v in found])[0]) == len(found))
+    s_print("MST {}: {} edges of weight {}, expected {} edges of weight {} (reference computed in {:.3f} s)".format(
+        "OK" if ok else "WRONG", len(found), found_weight, len(expected), expected_weight, elapsed))
+    if not ok:
+        s_print("Missing edges: {}".format(_some(expected - found)))
+        s_print("Extra edges: {}".format(_some(found - expected)))
+    return ok
+
+
+def _some(edges: Set[Tuple[int, int]]) -> str:
+    # The first SHOWN_EDGES edges, a large graph can miss thousands
+    shown = sorted(edges)
+    if len(shown) <= SHOWN_EDGES:
+        return str(shown)
+    return "{} ... and {} more".format(shown[:SHOWN_EDGES], len(shown) - SHOWN_EDGES)
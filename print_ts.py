@@ -1,9 +1,173 @@
+"""
+    Logging : s_print for the few lines printed by the main thread, log for everything printed while the nodes run
+
+log only stores the arguments, the formatting and the writes are done by a background thread. Entries below the level
+of their category are dropped before anything else, see configure.
+"""
+import atexit
+import collections
+import os
+import struct
+import sys
+import threading
+import time
 from threading import Lock
+from typing import Dict, Iterable, Optional
 
 s_print_lock = Lock()
 
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+
+# send / receive: every message, protocol: steps of the algorithm, transport: sockets
+CATEGORIES = ("send", "receive", "protocol", "transport")
+
+DRAIN_INTERVAL = 0.05  # The writer writes what was logged every DRAIN_INTERVAL (s)
+
+# Binary trace: one definition record the first time a format is used, then one entry record per log call followed
+# by its arguments
+DEFINITION = struct.Struct("<BHH")  # 0, format id, length of the utf-8 format
+ENTRY = struct.Struct("<BdBBHB")  # 1, time, level, category index, format id, number of arguments
+INT_ARG = struct.Struct("<Bq")  # 0, value
+STR_ARG = struct.Struct("<BH")  # 1, length of the utf-8 str() of the value
+
+# Minimum level of each category, entries below it are dropped. Read without lock on the hot path
+thresholds: Dict[str, int] = {category: DEBUG for category in CATEGORIES}
+
+# Appending to a deque is atomic, the nodes never wait for each other nor for the writer
+_entries = collections.deque()
+_writer: Optional[threading.Thread] = None
+_writer_lock = Lock()
+_out = sys.stdout
+_binary_path: Optional[str] = None
+_binary = False
+_formats: Dict[str, int] = {}
+
 
 def s_print(*a, **b):
     """Thread safe print function"""
     with s_print_lock:
+        flush()
         print(*a, **b)
+
+
+def configure(level: int = DEBUG, categories: Optional[Iterable[str]] = None, binary_path: Optional[str] = None):
+    # Log the entries of at least level, in the given categories only (all by default). With binary_path, write a
+    # binary trace there instead of text on stdout, see read_trace. A forked process writes its own trace, binary_path
+    # followed by its pid
+    global _out, _binary, _binary_path
+    flush()
+    for category in CATEGORIES:
+        enabled = categories is None or category in categories
+        thresholds[category] = level if enabled else ERROR + 1
+    if binary_path is not None:
+        _out = open(binary_path, "wb")
+        _binary = True
+        _binary_path = binary_path
+        _formats.clear()
+
+
+def log(level: int, category: str, fmt: str, *args):
+    # fmt.format(*args) is only called by the writer, the arguments must not change once logged
+    if level < thresholds[category]:
+        return
+    _entries.append((time.time(), level, category, fmt, args))
+    if _writer is None:
+        _start_writer()
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, daemon=True)
+            _writer.start()
+
+
+def _write_loop():
+    while True:
+        time.sleep(DRAIN_INTERVAL)
+        flush()
+
+
+def flush():
+    # Write every entry logged so far
+    with _writer_lock:
+        chunks = []
+        while _entries:
+            entry = _entries.popleft()
+            chunks.append(_encode(*entry) if _binary else entry[3].format(*entry[4]) + "\n")
+        if chunks:
+            _out.write((b"" if _binary else "").join(chunks))
+            _out.flush()
+
+
+def _encode(timestamp: float, level: int, category: str, fmt: str, args) -> bytes:
+    chunks = []
+    format_id = _formats.get(fmt)
+    if format_id is None:
+        format_id = _formats[fmt] = len(_formats)
+        raw = fmt.encode()
+        chunks += [DEFINITION.pack(0, format_id, len(raw)), raw]
+    chunks.append(ENTRY.pack(1, timestamp, level, CATEGORIES.index(category), format_id, len(args)))
+    for arg in args:
+        if isinstance(arg, int):
+            chunks.append(INT_ARG.pack(0, arg))
+        else:
+            raw = str(arg).encode()
+            chunks += [STR_ARG.pack(1, len(raw)), raw]
+    return b"".join(chunks)
+
+
+def read_trace(path: str):
+    # Yield (time, level, category, text) for each entry of a binary trace
+    with open(path, "rb") as file:
+        data = file.read()
+    formats = {}
+    offset = 0
+    while offset < len(data):
+        if data[offset] == 0:
+            _, format_id, length = DEFINITION.unpack_from(data, offset)
+            offset += DEFINITION.size
+            formats[format_id] = data[offset:offset + length].decode()
+            offset += length
+            continue
+
+        _, timestamp, level, category, format_id, nb_args = ENTRY.unpack_from(data, offset)
+        offset += ENTRY.size
+        args = []
+        for _ in range(nb_args):
+            if data[offset] == 0:
+                args.append(INT_ARG.unpack_from(data, offset)[1])
+                offset += INT_ARG.size
+            else:
+                (_, length) = STR_ARG.unpack_from(data, offset)
+                offset += STR_ARG.size
+                args.append(data[offset:offset + length].decode())
+                offset += length
+        yield timestamp, level, CATEGORIES[category], formats[format_id].format(*args)
+
+
+def _after_fork():
+    # The writer thread does not survive a fork, the child starts its own
+    global _writer, _writer_lock, _out
+    _writer = None
+    _writer_lock = Lock()
+    _entries.clear()
+    if _binary:
+        _out = open("{}.{}".format(_binary_path, os.getpid()), "wb")
+        _formats.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+atexit.register(flush)
+
+
+if __name__ == "__main__":
+    # python print_ts.py trace.bin : print a binary trace as text
+    names = {value: name for name, value in LEVELS.items()}
+    for timestamp, level, category, text in read_trace(sys.argv[1]):
+        print("{:.6f} {:<7} {:<9} {}".format(timestamp, names.get(level, level), category, text))
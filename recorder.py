@@ -0,0 +1,219 @@
+"""
+    Message recorder : every message sent and delivered during a run, as fixed-size binary records, and the offline
+    replay of a recorded run
+
+    python script.py --graph Neighbours_simple --record run.rec
+    python recorder.py run.rec --graph Neighbours_simple
+
+A record is the time, the event (SENT or DELIVERED), the sender and destination ids, the MessageType, the fragment,
+level and weight carried by the message and its first MAX_PARAMS params. The replay hands the DELIVERED records, in the
+recorded order, to script.handle on nodes built from the same graph, without any socket nor thread, and measures
+every handler. A forked process (sharded engine) records in its own file, the path followed by its pid: give all of
+them to the replay, the records are merged by time.
+"""
+import argparse
+import heapq
+import os
+import struct
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from items import MESSAGE_TYPES, Message, MessageType, Node
+from transport import Transport, TransportWrapper
+from utils import make_init_node
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SENT = 0
+DELIVERED = 1
+MAX_PARAMS = 2  # Params beyond are not recorded, a replayed message keeps only the first ones
+
+# time, event, sender id, destination id, MessageType, fragment, level, weight, number of params, params
+RECORD = struct.Struct("<dBIIBIIqB" + "q" * MAX_PARAMS)
+NO_PARAMS = (0,) * MAX_PARAMS
+# Same layout, to read a whole file at once with NumPy, see read_array
+RECORD_FIELDS = [("time", "<f8"), ("event", "u1"), ("sender", "<u4"), ("destination", "<u4"), ("type", "u1"),
+                 ("fragment", "<u4"), ("level", "<u4"), ("weight", "<i8"), ("nb_param", "u1")] + \
+                [("param{}".format(i), "<i8") for i in range(MAX_PARAMS)]
+
+
+class Recorder:
+    def __init__(self, path: str):
+        self.path = path
+        # BufferedWriter.write holds a lock, the records of two threads are never mixed
+        self.file = open(path, "wb", buffering=1 << 20)
+
+    def record(self, event: int, dst_id: int, message: Message):
+        param = message.param
+        params = tuple(param[:MAX_PARAMS]) + NO_PARAMS[len(param):] if param else NO_PARAMS
+        self.file.write(RECORD.pack(time.perf_counter(), event, message.sender, dst_id, message.message_type.value,
+                                    message.fragment, message.level, message.weight, len(param), *params))
+
+    def instrument(self, nodes: List[Node]):
+        # Record what the nodes send. What they receive is recorded by the handler, see dispatcher
+        for node in nodes:
+            node.transport = RecordingTransport(node.transport, self)
+
+    def handle(self, handler, node: Node, node_from: Node, message: Message):
+        self.record(DELIVERED, node.id, message)
+        handler(node, node_from, message)
+
+    def close(self):
+        self.file.close()
+
+
+class RecordingTransport(TransportWrapper):
+    # Record the messages sent through another transport
+    def __init__(self, inner: Transport, recorder: Recorder):
+        super().__init__(inner)
+        self.recorder = recorder
+
+    def send(self, message: Message, node_dst: Node):
+        self.recorder.record(SENT, node_dst.id, message)
+        self.inner.send(message, node_dst)
+
+
+recorder: Optional[Recorder] = None
+
+
+def dispatcher(handler):
+    # handler itself when nothing is recorded, as metrics.dispatcher
+    if recorder is None:
+        return handler
+    return lambda node, node_from, message: recorder.handle(handler, node, node_from, message)
+
+
+def enable(path: str) -> Recorder:
+    # Record the next runs of all the engines in path
+    global recorder
+    recorder = Recorder(path)
+    return recorder
+
+
+def close():
+    global recorder
+    if recorder is not None:
+        recorder.close()
+        recorder = None
+
+
+def _after_fork():
+    # The child must not write in the file of its parent
+    global recorder
+    if recorder is not None:
+        recorder = Recorder("{}.{}".format(recorder.path, os.getpid()))
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def read(path: str) -> Iterator[Tuple[float, int, int, Message]]:
+    # Yield (time, event, destination id, message) for each record of path
+    with open(path, "rb") as file:
+        data = file.read()
+    for timestamp, event, sender, dst_id, message_type, fragment, level, weight, nb_param, *params in \
+            RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]):
+        message = Message(MESSAGE_TYPES[message_type], params[:min(nb_param, MAX_PARAMS)], weight)
+        message.sender = sender
+        message.fragment = fragment
+        message.level = level
+        yield timestamp, event, dst_id, message
+
+
+def read_array(path: str):
+    # All the records of path as a NumPy structured array, fields named as in RECORD_FIELDS. Much faster than read
+    # to count or filter the records
+    data = np.fromfile(path, dtype=np.uint8)
+    return data[:len(data) - len(data) % RECORD.size].view(np.dtype(RECORD_FIELDS))
+
+
+def read_all(paths: List[str]) -> Iterator[Tuple[float, int, int, Message]]:
+    # The records of several files, merged by time
+    return heapq.merge(*(read(path) for path in paths), key=lambda r: r[0])
+
+
+class ReplayTransport(Transport):
+    # The messages sent while replaying are only counted, the recorded deliveries stand for them
+    def __init__(self, counts: Dict[MessageType, int]):
+        self.counts = counts
+
+    def send(self, message: Message, node_dst: Node):
+        self.counts[message.message_type] = self.counts.get(message.message_type, 0) + 1
+
+
+def replay(paths: List[str], nodes: List[Node], dispatch=None) -> dict:
+    # Hand the recorded deliveries to dispatch (script.handle by default) in their order. Return the time spent in
+    # each MessageType handler, and the messages sent by the replay and by the recorded run
+    import script
+
+    sent: Dict[MessageType, int] = {}
+    recorded_sent: Dict[MessageType, int] = {}
+    init_node = make_init_node(nodes)
+    for node in nodes + [init_node]:
+        node.transport = ReplayTransport(sent)
+    script.nodes_by_id = {node.id: node for node in nodes + [init_node]}
+    dispatch = dispatch or script.handle
+
+    handler_time: Dict[MessageType, float] = {}
+    handled: Dict[MessageType, int] = {}
+    start = time.perf_counter()
+    for _, event, dst_id, message in read_all(paths):
+        message_type = message.message_type
+        if event == SENT:
+            recorded_sent[message_type] = recorded_sent.get(message_type, 0) + 1
+            continue
+        node = script.nodes_by_id[dst_id]
+        if node.terminated:
+            continue
+
+        handler_start = time.perf_counter()
+        dispatch(node, script.nodes_by_id[message.sender], message)
+        handler_time[message_type] = handler_time.get(message_type, 0.0) + time.perf_counter() - handler_start
+        handled[message_type] = handled.get(message_type, 0) + 1
+        if node.terminated:
+            script.terminate_children(node)
+
+    return {"elapsed_s": time.perf_counter() - start, "handled": handled, "handler_time_s": handler_time,
+            "sent": sent, "recorded_sent": recorded_sent}
+
+
+if __name__ == "__main__":
+    import print_ts
+    from mst import check
+    from utils import read_graph
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", help="recorded files, all the files of a sharded run")
+    parser.add_argument("--graph", default="Neighbours_simple", help="graph of the recorded run, as for script.py")
+    args = parser.parse_args()
+
+    print_ts.configure(print_ts.WARNING)
+
+    # Reading alone, then the replay
+    start = time.perf_counter()
+    if np is not None:
+        nb_records = sum(len(read_array(path)) for path in args.paths)
+    else:
+        nb_records = sum(1 for _ in read_all(args.paths))
+    reading = time.perf_counter() - start
+
+    nodes = read_graph(args.graph, None)
+    stats = replay(args.paths, nodes)
+    nb_handled = sum(stats["handled"].values())
+    print("{} records read in {:.3f} s ({:.0f} records/s)".format(nb_records, reading, nb_records / max(reading, 1e-9)))
+    print("{} deliveries replayed in {:.3f} s ({:.0f} deliveries/s)".format(
+        nb_handled, stats["elapsed_s"], nb_handled / max(stats["elapsed_s"], 1e-9)))
+    print("{:>12} {:>9} {:>10} {:>9} {:>9}".format("type", "handled", "mean us", "sent", "recorded"))
+    for message_type in MessageType:
+        count = stats["handled"].get(message_type, 0)
+        if count or message_type in stats["recorded_sent"]:
+            mean = stats["handler_time_s"].get(message_type, 0.0) / count * 1e6 if count else 0.0
+            print("{:>12} {:>9} {:>10.1f} {:>9} {:>9}".format(message_type.name, count, mean,
+                                                           stats["sent"].get(message_type, 0),
+                                                           stats["recorded_sent"].get(message_type, 0)))
+
+    # Same tree as the recorded run
+    check(nodes)
@@ -1,35 +1,111 @@
 """
     Algorithm : Constructing a Minimum Spanning Tree
 """
-import copy
+import argparse
 import os
-import queue
 import sys
 import threading
+import time
+import traceback
 from typing import List, Optional
 
-from items import Node, Message, MessageType, Neighbour, EdgeState, NodeState
-from utils import read_files, bcolors, neighbour_from_node, get_neighbour_of_parent, neighbour_from_id, \
-    find_least_weighted_neighbour
-from print_ts import s_print
+from items import Node, Message, MessageType, Neighbour, EdgeState, NodeState, edge_id, edge_ends
+from utils import read_edges, read_graph, bcolors, neighbour_from_node, get_neighbour_of_parent, neighbour_from_id, \
+    make_init_node
+from mst import check, edges_from_nodes, member_edges
+import convergecast
+import metrics
+import print_ts
+import recorder
+from print_ts import DEBUG, ERROR, INFO, WARNING, log, s_print
+from termination import Detector
+from transport import InMemoryNetwork, TcpTransport, directory
 
 nodes = []  # Contains all nodes
+nodes_by_id = {}  # Index of nodes, built once the nodes are read
 
+# Test the BASIC edges one at a time in weight order, stopping at the first ACCEPT, instead of all of them at once
+ORDERED_TESTING = True
 
-# Retrieve node from ip
-def get_node_from_ip(ip):
-    # Retrieve node from ip. Return node
-    for neigh in nodes:
-        if neigh.address == ip:
-            return neigh
+# The two phases of a fragment, as waves over its tree, see convergecast.py. The new fragment and level go down with
+# NEW_FRAGMENT and the ACKs only count. The MWOE search goes down with DOTEST, and each REPORT carries the lightest
+# outgoing edge of the subtree as (weight, edge id), the min of the REPORTs of the children and of the TESTs of the node
+NO_EDGE = (sys.maxsize, 0)
+FRAGMENT = convergecast.Wave(MessageType.NEW_FRAGMENT, MessageType.ACK)
+MWOE = convergecast.Wave(MessageType.DOTEST, MessageType.REPORT, combine=min, identity=NO_EDGE,
+                         to_message=lambda best: ([best[1]], best[0]),
+                         from_message=lambda message: (message.weight, message.param[0]))
 
 
-# Initialize all nodes
+# Retrieve node from id
+def get_node_from_id(id):
+    # Retrieve node from id. Return node
+    return nodes_by_id.get(id)
+
+
+# Initialize all nodes: each one is a fragment of its own, looking for its lightest edge
 def initialize(node: Node):
-    node.barrier = len(node.neighbours)
-    for neigh in node.neighbours:
+    search_mwoe(node)
+
+
+# Start the MWOE search in the subtree of node: test its own edges and send DOTEST to its children
+def search_mwoe(node: Node):
+    if ORDERED_TESTING:
+        local = 1 if test_next(node) else 0
+    else:
+        local = 0
+        for neigh in node.neighbours:
+            if neigh.edge.state == EdgeState.BASIC:
+                local += 1
+                node.send(Message(MessageType.TEST, []), neigh.node)
+
+    if convergecast.start(node, MWOE, local):
+        mwoe_found(node)
+
+
+# At the root, once the MWOE search is over: stop if the fragment has no outgoing edge, else merge over it
+def mwoe_found(node: Node):
+    (weight, _), _ = convergecast.result(node, MWOE)
+    log(DEBUG, "protocol", "Node {} his min. weight = {}", node.id, weight)
+    if weight == sys.maxsize:
+        node.terminated = True
+        log(INFO, "protocol", "Node {} terminated", node.id)
+    else:
+        merge(node)
+
+
+# Follow the REPORTs down to the node of the MWOE, which sends CONNECT over it
+def merge(node: Node):
+    (_, edge), source = convergecast.result(node, MWOE)
+    if source is not node:
+        node.send(Message(MessageType.MERGE, []), source)
+        return
+
+    u, v = edge_ends(edge)
+    neighbour = neighbour_from_id(v if u == node.id else u, node)
+    node.sent_connection.add(neighbour.node.id)
+    node.send(Message(MessageType.CONNECT, []), neighbour.node)
+
+    connexions_manager(node, neighbour.node)
+
+
+# Send a TEST on the lightest BASIC edge of node. Return False if none is left. The edges never go back to BASIC, so
+# the ones skipped are never looked at again
+def test_next(node: Node) -> bool:
+    while node.next_test < len(node.neighbours):
+        neigh = node.neighbours[node.next_test]
         if neigh.edge.state == EdgeState.BASIC:
-            node.send(Message(MessageType.TEST, []), copy.copy(neigh.node))
+            node.send(Message(MessageType.TEST, []), neigh.node)
+            return True
+        node.next_test += 1
+    return False
+
+
+# The edge to node_from links two nodes of the same fragment, it will never be part of the tree
+def reject_edge(node: Node, node_from: Node):
+    neighbour_from = neighbour_from_node(node_from, node)
+    if neighbour_from is not None and neighbour_from.edge.state == EdgeState.BASIC:
+        neighbour_from.edge.state = EdgeState.NON_MEMBER
 
 
 # Manage the case when Node A and B sent both a CONNEXION request
@@ -37,7 +113,7 @@ def connexions_manager(node, node_from):
     if node_from.id in node.received_connexion and node_from.id in node.sent_connection:
         if node.id != node_from.id:
             node.children.add(node_from.id)
-        neighbour_from = neighbour_from_node(node_from, node.neighbours)
+        neighbour_from = neighbour_from_node(node_from, node)
         neighbour_from.edge.state = EdgeState.MEMBER
 
         if node.fragment != node.id:
@@ -48,262 +124,400 @@ def connexions_manager(node, node_from):
                 node.children.add(node.parent)
             node.fragment = node.id
             node.parent = node.id
+        node.level += 1
 
         node.sent_connection.remove(node_from.id)
         node.received_connexion.remove(node_from.id)
 
-        s_print("Node {} new fragment and becomes root".format(node.id))
-        node.send(Message(MessageType.NEW_FRAGMENT, []), copy.copy(node))
+        log(DEBUG, "protocol", "Node {} new fragment and becomes root", node.id)
+        node.send(Message(MessageType.NEW_FRAGMENT, []), node)
 
 
-# Function used in thread to listen to the socket and store the message in the queue
-def process_receiver(node: Node, q: queue.Queue, kill: threading.Event):
-    while not kill.wait(1):
-        q.put(node.receive())
+# Handle one message received by node from node_from. Shared by all the engines
+def handle(node: Node, node_from: Node, message: Message):
+    if node.id in node.children:
+        node.children.remove(node.id)
 
+    message_type = message.message_type
+    log(DEBUG, "receive", "Node {} receives a {} from node {}", node.id, message_type, node_from.id)
 
-def process(node, b_init: threading.Barrier):
-    # Set up the queue and the receiver thread
-    q_work = queue.Queue()
-    kill = threading.Event()
-    receive_t = threading.Thread(target=process_receiver, args=(node, q_work, kill))
-    receive_t.start()
+    match message_type:
+        case MessageType.INIT:
+            initialize(node)
+        case MessageType.NEW_FRAGMENT:
+            # Adopt the node_from fragment, as carried by the message since node_from may live in another process
+            node.fragment = message.fragment
+            node.level = message.level
 
-    b_init.wait()
+            if node.id != message.fragment:
+                if node.id != node.parent:
+                    # Place the parent in the children if one
+                    parent_neighbour = get_neighbour_of_parent(node)
+                    if parent_neighbour:
+                        parent_neighbour.edge.state = EdgeState.MEMBER
+                        if node.parent != node.id:
+                            node.children.add(node.parent)
 
-    # Run until the node has terminated
-    while not node.terminated:
+                # Get neighbour corresponding to the node_from
+                neighbour_from = neighbour_from_node(node_from, node)
 
-        if node.id in node.children:
-            node.children.remove(node.id)
+                neighbour_from.edge.state = EdgeState.MEMBER
+                # My parent becom my child
+                if neighbour_from.node.id in node.children and node.id != node_from.id:
+                    node.children.remove(node_from.id)
 
-        # If there is a message in the queue
-        if not q_work.empty():
-            # Get the message
-            node_from_address, message = q_work.get()
+                node.parent = neighbour_from.node.id
 
-            node_from = get_node_from_ip(node_from_address)
-            message_type = message.message_type
-            s_print("Node {} receives a {} from node {}".format(node.id, message_type, node_from.id))
+            temp = node.received_connexion.copy()
+            for nd_id in temp:
+                if node.parent != nd_id:
+                    node.received_connexion.remove(nd_id)
 
-            match message_type:
-                case MessageType.INIT:
-                    initialize(node)
-                case MessageType.NEW_FRAGMENT:
-                    # Adopt the node_from fragment
-                    node.fragment = node_from.fragment
-                    node.ack = 0
-                    node.min_weight = sys.maxsize
-
-                    if node.id != node_from.fragment:
-                        if node.id != node.parent:
-                            # Place the parent in the children if one
-                            parent_neighbour = get_neighbour_of_parent(node)
-                            if parent_neighbour:
-                                parent_neighbour.edge.state = EdgeState.MEMBER
-                                if node.parent != node.id:
-                                    node.children.add(node.parent)
-
-                        # Get neighbour corresponding to the node_from
-                        neighbour_from = neighbour_from_node(node_from, node.neighbours)
+                    if node.id != node_from.id:
+                        node.children.add(node_from.id)
 
+                    neighbour_from = neighbour_from_id(nd_id, node)
+                    if neighbour_from:
                         neighbour_from.edge.state = EdgeState.MEMBER
-                        # My parent becom my child
-                        if neighbour_from.node.id in node.children and node.id != node_from.id:
-                            node.children.remove(node_from.id)
-
-                        node.parent = neighbour_from.node.id
-
-                    temp = node.received_connexion.copy()
-                    for nd_id in temp:
-                        if node.parent != nd_id:
-                            node.received_connexion.remove(nd_id)
-
-                            if node.id != node_from.id:
-                                node.children.add(node_from.id)
-
-                            neighbour_from = neighbour_from_id(nd_id, node.neighbours)
-                            if neighbour_from:
-                                neighbour_from.edge.state = EdgeState.MEMBER
-                            else:
-                                s_print("!!!!!!!! Node {} has not node {} as neighbour".format(node.id, nd_id))
-
-                    # Send NEW_FRAGMENT message to children
-                    tmp = node.children.copy()
-                    for c_id in tmp:
-                        node.ack += 1
-                        child_neighbour = neighbour_from_id(c_id, node.neighbours)
-                        if child_neighbour:
-                            node.send(Message(MessageType.NEW_FRAGMENT, []), copy.copy(child_neighbour.node))
-                        else:
-                            s_print("!!!!!!!! Node {} has not  {} as child".format(node.id, c_id))
-
-                    # if no child, send ACK to parent
-                    if len(node.children) == 0:
-                        if node.id == node.parent:
-                            node.send(Message(MessageType.ACK, []), copy.copy(node))
-                        else:
-                            node.send(Message(MessageType.ACK, []),
-                                      copy.copy(neighbour_from_id(node.parent, node.neighbours)))
-
-                case MessageType.CONNECT:
-                    node.received_connexion.add(node_from.id)
-
-                    connexions_manager(node, node_from)
-
-                case MessageType.MERGE:
-                    # if i'm the root
-                    if node.to_mwoe == node:
-                        # find the minimal weighted neighbour and send a connect to it
-                        least_neighbour = find_least_weighted_neighbour(node.neighbours)
-                        node.sent_connection.add(least_neighbour.node.id)
-                        node.send(Message(MessageType.CONNECT, []), copy.copy(least_neighbour.node))
-
-                        connexions_manager(node, least_neighbour.node)
-
                     else:
-                        node.send(Message(MessageType.MERGE, []), copy.copy(node.to_mwoe))
-
-                case MessageType.TEST:
-                    if node_from.fragment != node.fragment:
-                        node.send(Message(MessageType.ACCEPT, []), copy.copy(node_from))
-                    else:
-                        node.send(Message(MessageType.REJECT, []), copy.copy(node_from))
-
-                case MessageType.ACCEPT:
-                    node.accepted.append(node_from)
-                    if node_from in node.rejected:
-                        node.rejected.remove(node_from)
-
-                    neighbour_from = neighbour_from_node(node_from, node.neighbours)
-                    try:
-                        if neighbour_from.edge.weight < node.min_weight:
-                            node.min_weight = neighbour_from.edge.weight
-                            node.to_mwoe = node
-                    except Exception:
-                        print(f"{bcolors.WARNING}{node}{node_from}{bcolors.ENDC}")
-
-                    node.barrier -= 1
-
-                case MessageType.REJECT:
-                    node.barrier -= 1
-                    node.count -= 1
-
-                    node.state = NodeState.IN if node.count == 0 else NodeState.OUT
-
-                    node.rejected.append(node_from)
-                    if node_from in node.accepted:
-                        node.accepted.remove(node_from)
-
-                case MessageType.REPORT:
-                    neighbour_from = neighbour_from_node(node_from, node.neighbours)
-
-                    node.barrier -= 1
-                    if neighbour_from.edge.weight < node.min_weight:
-                        node.to_mwoe = node_from
-                        node.min_weight = neighbour_from.edge.weight
-
-                case MessageType.ACK:
-                    node.ack -= 1
-                    if node.ack == 0:
-                        # report to parent if not the root
-                        if node.fragment != node.id:
-                            if node.id == node.parent:
-                                node.send(Message(MessageType.ACK, []), copy.copy(node))
-                            else:
-                                node.send(Message(MessageType.ACK, []),
-                                          copy.copy(neighbour_from_id(node.parent, node.neighbours)))
-
-                        else:
-                            node.send(Message(MessageType.DOTEST, []), copy.copy(node))
-
-                case MessageType.DOTEST:
-                    node.barrier = 0
-                    for neigh in node.neighbours:
-                        if neigh.edge.state == EdgeState.BASIC:
-                            node.barrier += 1
-                            node.send(Message(MessageType.TEST, []), copy.copy(neigh.node))
-                        elif neigh.node.id in node.children:
-                            node.barrier += 1
-                            node.send(Message(MessageType.DOTEST, []), copy.copy(neigh.node))
-
-                case MessageType.TERMINATE:
-                    node.terminated = True
-                    s_print("Node {} terminated".format(node.id))
-                    kill.set()
-                    receive_t.join()
-                    print(f"{bcolors.OKGREEN}{node.id}terminated{bcolors.ENDC}")
-
-            if node.barrier == 0:
-                s_print("Node {} passed barrier".format(node.id))
-                if node.state == NodeState.OUT:
-                    node.count = len(node.neighbours)
-
-                node.barrier -= 1
-
-                # The node is the root
-                if node.fragment == node.id:
-                    s_print("Node {} his min. weight = {}".format(node.id, node.min_weight))
-                    if node.min_weight == sys.maxsize:
-                        node.terminated = True
-                        s_print("Node {} terminated".format(node.id))
-                        kill.set()
-                        receive_t.join()
-                        print(f"{bcolors.OKGREEN}{node.id}terminated{bcolors.ENDC}")
-
-                    else:
-                        # merge down
-                        node.send(Message(MessageType.MERGE, []), copy.copy(node.to_mwoe))
-                else:
-                    # report up
-                    if node.id == node.parent:
-                        node.send(Message(MessageType.REPORT, []), copy.copy(node))
-                    else:
-                        node.send(Message(MessageType.REPORT, []),
-                                  copy.copy(neighbour_from_id(node.parent, node.neighbours)))
-
+                        log(WARNING, "protocol", "!!!!!!!! Node {} has not node {} as neighbour", node.id, nd_id)
+
+            # Send NEW_FRAGMENT to the children, ACK to the parent once they all answered
+            if convergecast.start(node, FRAGMENT):
+                search_mwoe(node)
+
+        case MessageType.CONNECT:
+            node.received_connexion.add(node_from.id)
+
+            connexions_manager(node, node_from)
+
+        case MessageType.MERGE:
+            merge(node)
+
+        case MessageType.TEST:
+            if message.fragment != node.fragment:
+                node.send(Message(MessageType.ACCEPT, []), node_from)
+            else:
+                if ORDERED_TESTING:
+                    reject_edge(node, node_from)
+                node.send(Message(MessageType.REJECT, []), node_from)
+
+        case MessageType.ACCEPT:
+            node.accepted.append(node_from)
+            if node_from in node.rejected:
+                node.rejected.remove(node_from)
+
+            neighbour_from = neighbour_from_node(node_from, node)
+            if neighbour_from is None:
+                log(WARNING, "protocol", bcolors.WARNING + "{}{}" + bcolors.ENDC, node, node_from)
+            elif convergecast.contribute(node, MWOE, (neighbour_from.edge.weight, edge_id(node.id, node_from.id)),
+                                         node):
+                mwoe_found(node)
+
+        case MessageType.REJECT:
+            node.count -= 1
+
+            node.state = NodeState.IN if node.count == 0 else NodeState.OUT
+
+            node.rejected.append(node_from)
+            if node_from in node.accepted:
+                node.accepted.remove(node_from)
+
+            if ORDERED_TESTING:
+                # Go on with the next lightest edge, the node has no outgoing edge once none is left
+                reject_edge(node, node_from)
+                if test_next(node):
+                    return
+            if convergecast.contribute(node, MWOE, NO_EDGE, node):
+                mwoe_found(node)
+
+        case MessageType.REPORT:
+            if convergecast.receive(node, MWOE, message, node_from):
+                mwoe_found(node)
+
+        case MessageType.ACK:
+            if convergecast.receive(node, FRAGMENT, message, node_from):
+                search_mwoe(node)
+
+        case MessageType.DOTEST:
+            search_mwoe(node)
+
+        case MessageType.TERMINATE:
+            node.terminated = True
+            log(INFO, "protocol", "Node {} terminated", node.id)
+
+
+# Handle one message through dispatch. A failing handler is logged and the engine goes on, so that the message still
+# counts as handled for the detector. Shared by all the engines
+def dispatch_safely(dispatch, node: Node, node_from: Node, message: Message):
+    try:
+        dispatch(node, node_from, message)
+    except Exception:
+        log(ERROR, "protocol", "Node {} failed to handle {}: {}", node.id, message.message_type, traceback.format_exc())
+
+
+def process(node, b_init: threading.Barrier, detector: Detector, dispatch=handle):
+    # Start filling the inbox of the node. If its listener can not bind (port in use, address of another host...),
+    # the barrier is broken, so that run and the other nodes do not wait for it
+    q_work = node.transport.inbox
+    try:
+        node.transport.start()
+    except Exception:
+        log(ERROR, "transport", "Node {} can not start: {}", node.id, traceback.format_exc())
+        b_init.abort()
+        return
+
+    try:
+        b_init.wait()
+    except threading.BrokenBarrierError:
+        node.transport.stop()
+        return
+
+    # Handle the messages until run stops the node, sleeping until a message arrives. A terminated node still empties
+    # its inbox, so that the detector sees every message handled
+    try:
+        while True:
+            # Get the message, None to stop right away
+            received = q_work.get()
+            if received is None:
+                break
+            node_from_id, message = received
+
+            if not node.terminated:
+                dispatch_safely(dispatch, node, get_node_from_id(node_from_id), message)
+                if node.terminated:
+                    log(INFO, "protocol", bcolors.OKGREEN + "{}terminated" + bcolors.ENDC, node.id)
+                    terminate_children(node)
+                    detector.node_terminated()
+            detector.handled[node.id] += 1
+    finally:
+        node.transport.stop()
+
+
+# Once terminated, propagate the termination to the children
+def terminate_children(node: Node):
     for c_id in node.children:
-        child_neighbour = neighbour_from_id(c_id, copy.copy(node.neighbours))
-        node.send(Message(MessageType.TERMINATE, []), copy.copy(child_neighbour.node))
-
+        child_neighbour = neighbour_from_id(c_id, node)
+        node.send(Message(MessageType.TERMINATE, []), child_neighbour.node)
 
-if __name__ == "__main__":
 
-    directory = "Neighbours_simple"
+# Run the threaded engine until all the nodes terminated, they are stuck or the deadline (s) is reached, see
+# termination.py. Return why it stopped, the time to compute and the time to stop all the nodes. The remote nodes run
+# in other processes, maybe on other hosts (see --hosts): they are only reached through the directory, and the run
+# can not be seen stuck from here
+def run(nodes: List[Node], transport, deadline: Optional[float] = None, remote: List[Node] = ()) -> dict:
+    global nodes_by_id
 
-    all_files_path = [
-        os.path.join(directory, "node-1.yaml"),
-        os.path.join(directory, "node-2.yaml"),
-        os.path.join(directory, "node-3.yaml"),
-        # os.path.join(directory, "node-4.yaml"),
-        # os.path.join(directory, "node-5.yaml"),
-        # os.path.join(directory, "node-6.yaml"),
-        # os.path.join(directory, "node-7.yaml"),
-        # os.path.join(directory, "node-8.yaml"),
-        # os.path.join(directory, "node-9.yaml"),
-    ]
+    # Used to wait for all thread to set up their queue and message processing, and to bind their listener
+    barrier_init = threading.Barrier(len(nodes) + 1)
 
-    # Read nodes from files
-    nodes = read_files(all_files_path)
-    nb_nodes = len(nodes)
+    # Dummy node to send the a INIT message to all the nodes to begin the algorithm
+    init_node = make_init_node(nodes + list(remote), transport)
+    nodes_by_id = {nd_.id: nd_ for nd_ in list(remote) + nodes + [init_node]}
 
-    # Used to wait for all thread to set up their queue and message processing
-    barrier_init = threading.Barrier(nb_nodes)
+    if metrics.registry is not None:
+        metrics.registry.instrument(nodes)
+    if recorder.recorder is not None:
+        recorder.recorder.instrument(nodes + [init_node])
+    dispatch = recorder.dispatcher(metrics.dispatcher(handle))
+    detector = Detector(len(nodes), quiescence=not remote)
+    detector.instrument(nodes + [init_node])
 
     # Start each node in a thread
+    start = time.perf_counter()
     threads = []
     for nd_ in nodes:
-        x = threading.Thread(target=process, args=(nd_, barrier_init))
+        x = threading.Thread(target=process, args=(nd_, barrier_init, detector, dispatch))
         x.start()
         threads.append(x)
 
-    # Dummy thread to send the a INIT message to all the nodes to begin the algorithm
-    init_node = Node(0, "127.0.0.1")
-    nodes.append(init_node)
-
-    for nd_ in nodes[:-1]:
-        init_node.send(Message(MessageType.INIT, []), nd_)
-
-    # Wait for the threads to finish
+    try:
+        barrier_init.wait()
+    except threading.BrokenBarrierError:
+        # A node could not start, see process
+        reason = "failed"
+    else:
+        for nd_ in nodes:
+            init_node.send(Message(MessageType.INIT, []), nd_)
+        reason = detector.wait(deadline)
+    compute = time.perf_counter() - start
+
+    # Stop every node right away: each thread stops its receiver, which is woken up through its waker
+    start = time.perf_counter()
+    for nd_ in nodes:
+        nd_.transport.inbox.put(None)
     for t in threads:
         t.join()
+    for nd_ in nodes + [init_node]:
+        nd_.close()
+
+    return {"reason": reason, "compute_s": compute, "teardown_s": time.perf_counter() - start}
+
+
+# Tell how a run of the threaded, asyncio or sharded engine ended, see termination.py
+def print_termination(stats: dict):
+    if stats["reason"] == "quiescent":
+        s_print(f"{bcolors.WARNING}No message left but not all the nodes terminated{bcolors.ENDC}")
+    elif stats["reason"] == "deadline":
+        s_print(f"{bcolors.WARNING}Deadline reached before all the nodes terminated{bcolors.ENDC}")
+    elif stats["reason"] == "failed":
+        s_print(f"{bcolors.WARNING}A node or a worker process failed, see the errors above{bcolors.ENDC}")
+    s_print("Run {}: compute {:.3f} s, teardown {:.4f} s".format(stats["reason"], stats["compute_s"],
+                                                               stats["teardown_s"]))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", choices=["threaded", "asyncio", "sharded", "rounds"], default="threaded",
+                        help="threaded: two threads per node, asyncio: all the nodes on one event loop, "
+                             "sharded: the nodes are split across worker processes, "
+                             "rounds: deterministic synchronous rounds, no thread nor socket")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="sharded engine only")
+    parser.add_argument("--link", choices=["tcp", "shm"], default="tcp",
+                        help="sharded engine only, how the workers exchange the messages on cut edges")
+    parser.add_argument("--transport", choices=["tcp", "memory"], default="tcp",
+                        help="threaded engine only, memory: messages are handed over in-process without sockets")
+    parser.add_argument("--graph", default="Neighbours_simple",
+                        help="directory of node-*.yaml files, or edge list file (.csv, .tsv or .npy of u, v, w)")
+    parser.add_argument("--addresses", help="address map of the nodes, one id,host,port line per node (tcp transport)")
+    parser.add_argument("--hosts", help="threaded engine with --addresses, comma separated: run only the nodes the map "
+                                        "puts on these hosts, the others are run by other processes")
+    parser.add_argument("--log-level", choices=list(print_ts.LEVELS), default="debug")
+    parser.add_argument("--log-categories", help="comma separated, among " + ", ".join(print_ts.CATEGORIES))
+    parser.add_argument("--log-binary", metavar="PATH",
+                        help="write a binary trace instead of text logs, read it with python print_ts.py PATH")
+    parser.add_argument("--metrics", metavar="PATH", help="measure the nodes and write the metrics as JSON at the end")
+    parser.add_argument("--metrics-port", type=int,
+                        help="measure the nodes and serve a Prometheus snapshot on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--arrays", action="store_true",
+                        help="rounds engine or memory transport, keep the edges in shared NumPy arrays (arrays.py)")
+    parser.add_argument("--max-rounds", type=int, default=None, help="rounds engine only, stop after this many rounds")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="threaded, asyncio and sharded engines, stop the nodes still running after this time (s)")
+    parser.add_argument("--record", metavar="PATH",
+                        help="record every message sent and delivered in PATH, to replay with recorder.py")
+    parser.add_argument("--updates", metavar="PATH",
+                        help="edge updates to apply to the tree at the end of the run, one u,v,w or u,v (deletion) "
+                             "line each (incremental.py)")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="take the tree from DIR if this graph was already run, else store it there (cache.py)")
+    args = parser.parse_args()
+    if args.updates and args.arrays:
+        parser.error("--updates needs Edge objects, it cannot be used with --arrays")
+    if args.hosts and (not args.addresses or args.engine != "threaded" or args.transport != "tcp"):
+        parser.error("--hosts needs --addresses, the threaded engine and the tcp transport")
+
+    print_ts.configure(print_ts.LEVELS[args.log_level],
+                       args.log_categories.split(",") if args.log_categories else None, args.log_binary)
+
+    start = time.perf_counter()
+
+    transport = TcpTransport if args.transport == "tcp" else InMemoryNetwork().transport
+    if args.engine == "rounds":
+        transport = None
+    if args.addresses:
+        directory.load(args.addresses)
+
+    # Read nodes from files
+    graph = None
+    if args.arrays:
+        from arrays import ArrayGraph
+
+        if os.path.isdir(args.graph):
+            graph = ArrayGraph(edges_from_nodes(read_graph(args.graph, None)))
+        else:
+            graph = ArrayGraph(read_edges(args.graph))
+        nodes = graph.nodes(transport)
+    else:
+        nodes = read_graph(args.graph, transport)
+
+    if args.record:
+        recorder.enable(args.record)
+
+    if args.metrics or args.metrics_port:
+        metrics.enable()
+        if args.metrics_port:
+            metrics.registry.serve(args.metrics_port)
+
+    result_cache = cached = None
+    if args.cache:
+        import cache
+
+        result_cache = cache.ResultCache(args.cache)
+        key = cache.graph_key(edges_from_nodes(nodes))
+        cached = result_cache.get(key)
+
+    if cached is not None:
+        cache.apply(nodes, cached)
+        s_print("Tree taken from the cache, no run")
+        ok = check(nodes)
+        s_print("Wall time {:.3f} s".format(time.perf_counter() - start))
+
+    elif args.engine == "asyncio":
+        import asyncio
+        import async_engine
+
+        stats = asyncio.run(async_engine.run(nodes, args.deadline))
+        print_termination(stats)
+        ok = check(nodes)
+        s_print("Wall time {:.3f} s, CPU time {:.3f} s".format(time.perf_counter() - start, time.process_time()))
+
+    elif args.engine == "rounds":
+        import simulator
+
+        terminated, stats = simulator.run(nodes, args.max_rounds, graph)
+        if not terminated:
+            s_print(f"{bcolors.WARNING}Not all the nodes terminated, {stats['in_flight']} messages left{bcolors.ENDC}")
+        s_print("{} rounds, {} messages, at most {} in one round".format(
+            stats["rounds"], stats["messages"], stats["max_messages_per_round"]))
+        ok = check(nodes)
+        s_print("Wall time {:.3f} s, CPU time {:.3f} s".format(time.perf_counter() - start, time.process_time()))
+
+    elif args.engine == "sharded":
+        import sharded
+
+        stats = sharded.run(nodes, args.workers, args.deadline, args.link)
+        s_print("{} workers, {} cut edges, {} messages in-process, {} between workers".format(
+            args.workers, stats["cut_edges"], stats["local_messages"], stats["remote_messages"]))
+        print_termination(stats)
+        ok = check(nodes)
+        s_print("Wall time {:.3f} s".format(time.perf_counter() - start))
+
+    elif args.hosts:
+        local, remote = directory.split(nodes, args.hosts.split(","))
+        stats = run(local, transport, args.deadline, remote)
+        print_termination(stats)
+        # The tree spans the processes, each one only knows the edges of its nodes
+        ok = False
+        s_print("{} local nodes, {} terminated, {} MEMBER edges seen from here".format(
+            len(local), sum(n.terminated for n in local), len(member_edges(local))))
+        s_print("Wall time {:.3f} s, CPU time {:.3f} s".format(time.perf_counter() - start, time.process_time()))
+
+    else:
+        stats = run(nodes, transport, args.deadline)
+        print_termination(stats)
+        ok = check(nodes)
+        s_print("Wall time {:.3f} s, CPU time {:.3f} s".format(time.perf_counter() - start, time.process_time()))
+
+    recorder.close()
+
+    if result_cache is not None:
+        # Only a run where every node terminated with the right tree: the protocol still stops early on some graphs,
+        # and a partial forest must not be served again
+        if cached is None and ok and all(n.terminated for n in nodes):
+            result_cache.put(key, cache.capture(nodes))
+        s_print("Cache: {}".format(result_cache.stats()))
+
+    if args.updates:
+        from incremental import IncrementalMst, read_updates
+
+        start = time.perf_counter()
+        updates = read_updates(args.updates)
+        visited = IncrementalMst(nodes).apply(updates)
+        s_print("{} updates applied in {:.3f} s, {} nodes read".format(len(updates), time.perf_counter() - start,
+                                                                      visited))
+        check(nodes)
+
+    if args.metrics:
+        metrics.registry.dump(args.metrics)
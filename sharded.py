@@ -0,0 +1,362 @@
+"""
+    Sharded engine : the nodes are partitioned across worker processes, each worker handles the messages of its own
+    nodes in a single thread. Messages between nodes of the same shard stay in the process, only the ones on cut
+    edges go between workers, over TCP or shared-memory rings
+"""
+import collections
+import multiprocessing
+import queue
+import selectors
+import socket
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+import print_ts
+import recorder
+import script
+from framing import FrameDecoder, encode_frame
+from items import EdgeState, Message, MessageType, Node
+from mst import edges_from_nodes
+from print_ts import ERROR, log
+from shm_ring import ShmRing, wait_any
+from termination import QUIESCENCE_INTERVAL, Detector
+from transport import Transport
+from utils import build_graph, make_init_node
+
+Edges = List[Tuple[int, int, int]]
+
+# A frame between workers is the destination id followed by the encoded message
+DESTINATION = struct.Struct("!I")
+
+
+def partition(edges: Edges, nb_shards: int) -> Dict[int, int]:
+    # Assign each node to a shard. Nodes are taken in breadth-first order and cut in contiguous blocks, so that most
+    # neighbours end up in the same shard
+    adjacency = collections.defaultdict(list)
+    for u, v, _ in edges:
+        adjacency[u].append(v)
+        adjacency[v].append(u)
+
+    order = []
+    seen = set()
+    for root in sorted(adjacency):
+        if root in seen:
+            continue
+        seen.add(root)
+        frontier = collections.deque([root])
+        while frontier:
+            x = frontier.popleft()
+            order.append(x)
+            for y in adjacency[x]:
+                if y not in seen:
+                    seen.add(y)
+                    frontier.append(y)
+
+    return {x: i * nb_shards // len(order) for i, x in enumerate(order)}
+
+
+def cut_size(edges: Edges, shards: Dict[int, int]) -> int:
+    return sum(1 for u, v, _ in edges if shards[u] != shards[v])
+
+
+class ShardRouter:
+    # Deliver the messages sent by the nodes of one shard: in the process when the destination is local, otherwise
+    # through the link to the worker owning it. Each message is counted as sent in counters, see ShardDetector, before
+    # it leaves: another worker may handle it, and count it as handled, as soon as it is written to the link
+    def __init__(self, shard: int, shards: Dict[int, int], counters):
+        self.shard = shard
+        self.shards = shards
+        self.counters = counters
+        self.inbox = queue.Queue()  # (destination id, sender id, message) for the nodes of this shard
+        self.local_messages = 0
+        self.remote_messages = 0
+
+    def send(self, message: Message, node_dst: Node):
+        self.counters[3 * self.shard + 1] += 1
+        shard = self.shards.get(node_dst.id, self.shard)
+        if shard == self.shard:
+            self.local_messages += 1
+            self.inbox.put((node_dst.id, message.sender, message))
+        else:
+            self.remote_messages += 1
+            self._send_remote(shard, node_dst.id, message)
+
+    def _send_remote(self, shard: int, dst_id: int, message: Message):
+        raise NotImplementedError
+
+    def start(self):
+        # Start filling the inbox with the messages of the other workers
+        pass
+
+    def close(self):
+        pass
+
+
+# Workers linked by one TCP stream per pair
+class TcpShardRouter(ShardRouter):
+    def __init__(self, shard: int, shards: Dict[int, int], counters):
+        super().__init__(shard, shards, counters)
+        self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.s.bind(("127.0.0.1", 0))
+        self.s.listen()
+        self.port = self.s.getsockname()[1]
+
+        self.ports: List[int] = []  # Listening port of each worker, known once all the workers are up
+        self.connections: Dict[int, socket.socket] = {}
+        self.locks = collections.defaultdict(threading.Lock)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.s, selectors.EVENT_READ)
+        self.waker, self.waker_w = socket.socketpair()
+        self.selector.register(self.waker, selectors.EVENT_READ)
+        self.decoders: Dict[socket.socket, FrameDecoder] = {}
+        self.receiver = threading.Thread(target=self._receive_loop, daemon=True)
+
+    def _send_remote(self, shard: int, dst_id: int, message: Message):
+        frame = encode_frame(DESTINATION.pack(dst_id) + message.encode())
+        with self.locks[shard]:
+            s = self.connections.get(shard)
+            if s is None:
+                s = socket.create_connection(("127.0.0.1", self.ports[shard]))
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.connections[shard] = s
+            s.sendall(frame)
+
+    def _receive_loop(self):
+        while True:
+            for key, _ in self.selector.select():
+                if key.fileobj is self.s:
+                    clientsocket, _ = self.s.accept()
+                    self.selector.register(clientsocket, selectors.EVENT_READ)
+                elif key.fileobj is self.waker:
+                    return
+                else:
+                    self._read(key.fileobj)
+
+    def _read(self, clientsocket: socket.socket):
+        data = clientsocket.recv(65536)
+        if not data:
+            self.selector.unregister(clientsocket)
+            clientsocket.close()
+            return
+        decoder = self.decoders.setdefault(clientsocket, FrameDecoder())
+        for frame in decoder.feed(data):
+            (dst_id,) = DESTINATION.unpack_from(frame)
+            message = Message.decode(frame[DESTINATION.size:])
+            self.inbox.put((dst_id, message.sender, message))
+
+    def start(self):
+        self.receiver.start()
+
+    def close(self):
+        self.waker_w.send(b"\0")
+        self.receiver.join()
+        for s in self.connections.values():
+            s.close()
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+        self.selector.close()
+        self.waker_w.close()
+
+
+# Workers linked by one shared-memory ring per ordered pair, see shm_ring.py
+class ShmShardRouter(ShardRouter):
+    def __init__(self, shard: int, shards: Dict[int, int], counters, rings_out: Dict[int, str], rings_in: List[str]):
+        super().__init__(shard, shards, counters)
+        self.rings_out = {other: ShmRing(name) for other, name in rings_out.items()}
+        self.rings_in = [ShmRing(name) for name in rings_in]
+        self.stopped = False
+        self.receiver = threading.Thread(target=self._receive_loop, daemon=True)
+
+    def _send_remote(self, shard: int, dst_id: int, message: Message):
+        # Only the dispatch thread of the worker sends, so each ring has a single producer
+        self.rings_out[shard].put(dst_id, message)
+
+    def _receive_loop(self):
+        while not self.stopped:
+            for dst_id, message in wait_any(self.rings_in, lambda: self.stopped):
+                self.inbox.put((dst_id, message.sender, message))
+
+    def start(self):
+        self.receiver.start()
+
+    def close(self):
+        self.stopped = True
+        self.receiver.join()
+        for ring in list(self.rings_out.values()) + self.rings_in:
+            ring.close()
+
+
+class ShardTransport(Transport):
+    # Transport of a node of the shard, everything goes through the router
+    def __init__(self, router: ShardRouter):
+        self.router = router
+        self.inbox = router.inbox  # Shared by all the nodes of the shard
+
+    def send(self, message: Message, node_dst: Node):
+        self.router.send(message, node_dst)
+
+
+class ShardDetector(Detector):
+    # Counters of the workers, in shared memory: messages handled, messages sent and nodes terminated, each slot only
+    # written by the dispatch thread of its worker
+    def __init__(self, nb_nodes: int, nb_workers: int):
+        super().__init__(nb_nodes)
+        self.counters = multiprocessing.Array("q", 3 * nb_workers, lock=False)
+        self.workers: List[multiprocessing.Process] = []
+
+    def totals(self) -> Tuple[int, int, int]:
+        counters = self.counters
+        return sum(counters[0::3]), sum(counters[1::3]), sum(counters[2::3])
+
+    def poll(self, end: Optional[float]) -> bool:
+        # A dead worker stops counting, the run could never be seen quiescent
+        if not self.done.is_set() and any(not w.is_alive() for w in self.workers):
+            self.finish("failed")
+        return super().poll(end)
+
+
+def worker(shard: int, edges: Edges, shards: Dict[int, int], link: str, setup, results: multiprocessing.Queue,
+           counters, stop: multiprocessing.Event, measure: bool):
+    if link == "shm":
+        rings_out, rings_in = setup
+        router = ShmShardRouter(shard, shards, counters, rings_out, rings_in)
+    else:
+        # Tell our port, then wait for the ports of all the workers
+        ports, all_ports = setup
+        router = TcpShardRouter(shard, shards, counters)
+        ports.put((shard, router.port))
+        router.ports = all_ports.recv()
+    router.start()
+
+    # Every process builds the whole graph, but only the nodes of its shard get a transport and run
+    nodes = build_graph(edges, lambda node: ShardTransport(router) if shards[node.id] == shard else None)
+    init_node = make_init_node(nodes)
+    script.nodes_by_id = {nd_.id: nd_ for nd_ in nodes + [init_node]}
+    local = {nd_.id: nd_ for nd_ in nodes if shards[nd_.id] == shard}
+    registry = metrics.enable() if measure else None
+    if registry is not None:
+        registry.instrument(list(local.values()))
+    if recorder.recorder is not None:
+        recorder.recorder.instrument(list(local.values()))
+    dispatch = recorder.dispatcher(metrics.dispatcher(script.handle))
+
+    for nd_ in local.values():
+        router.inbox.put((nd_.id, init_node.id, Message(MessageType.INIT, [])))
+
+    # Handle the messages of the local nodes until the parent tells the run is over, see ShardDetector. The INIT
+    # messages were already counted as sent by the parent, the others are counted by the router
+    base = 3 * shard
+    while not stop.is_set():
+        try:
+            dst_id, sender_id, message = router.inbox.get(timeout=QUIESCENCE_INTERVAL)
+        except queue.Empty:
+            continue
+        node = local[dst_id]
+        if not node.terminated:
+            script.dispatch_safely(dispatch, node, script.nodes_by_id[sender_id], message)
+            if node.terminated:
+                script.terminate_children(node)
+                counters[base + 2] += 1
+        counters[base] += 1
+
+    results.put((shard, {
+        "states": [(nd_.id, nd_.parent, sorted(nd_.children), nd_.fragment, nd_.terminated,
+                    [neigh.node.id for neigh in nd_.neighbours if neigh.edge.state == EdgeState.MEMBER])
+                   for nd_ in local.values()],
+        "local_messages": router.local_messages,
+        "remote_messages": router.remote_messages,
+        "metrics": registry.nodes if registry is not None else None,
+    }))
+    router.close()
+    recorder.close()
+    # A worker process ends without running atexit, the logs still queued would be lost
+    print_ts.flush()
+
+
+def _results(results: multiprocessing.Queue, workers: List[multiprocessing.Process]):
+    # Yield the result of each worker. A worker that died sends none, stop waiting once all the others are in
+    missing = set(range(len(workers)))
+    all_exited = False
+    while missing:
+        try:
+            shard, result = results.get(timeout=QUIESCENCE_INTERVAL)
+        except queue.Empty:
+            if all_exited:
+                log(ERROR, "transport", "Workers {} died without a result", sorted(missing))
+                return
+            # One more wait once they all exited: what a worker sends is in the pipe before it exits
+            all_exited = not any(workers[shard].is_alive() for shard in missing)
+            continue
+        missing.discard(shard)
+        yield result
+
+
+def run(nodes: List[Node], nb_workers: int, deadline: Optional[float] = None, link: str = "tcp") -> dict:
+    # Run the nodes on nb_workers processes, linked by "tcp" or "shm", then copy the final states back into nodes.
+    # Return the statistics
+    edges = edges_from_nodes(nodes)
+    shards = partition(edges, nb_workers)
+    for nd_ in nodes:
+        shards.setdefault(nd_.id, 0)
+
+    results = multiprocessing.Queue()
+    detector = ShardDetector(len(nodes), nb_workers)
+    for nd_ in nodes:
+        detector.counters[3 * shards[nd_.id] + 1] += 1
+    stop = multiprocessing.Event()
+    if link == "shm":
+        rings = {(i, j): ShmRing() for i in range(nb_workers) for j in range(nb_workers) if i != j}
+        setups = [({j: rings[(i, j)].name for j in range(nb_workers) if j != i},
+                   [rings[(j, i)].name for j in range(nb_workers) if j != i]) for i in range(nb_workers)]
+    else:
+        ports = multiprocessing.Queue()
+        pipes = [multiprocessing.Pipe(duplex=False) for _ in range(nb_workers)]
+        setups = [(ports, recv_end) for recv_end, _ in pipes]
+
+    start = time.perf_counter()
+    workers = []
+    for shard in range(nb_workers):
+        w = multiprocessing.Process(target=worker, args=(shard, edges, shards, link, setups[shard], results,
+                                                         detector.counters, stop, metrics.registry is not None))
+        w.start()
+        workers.append(w)
+    detector.workers = workers
+
+    if link == "tcp":
+        # Once every worker listens, tell all of them where the others are
+        worker_ports = dict(ports.get() for _ in workers)
+        for _, send_end in pipes:
+            send_end.send([worker_ports[shard] for shard in range(nb_workers)])
+
+    reason = detector.wait(deadline)
+    compute = time.perf_counter() - start
+    start = time.perf_counter()
+    stop.set()
+
+    by_id = {nd_.id: nd_ for nd_ in nodes}
+    stats = {"cut_edges": cut_size(edges, shards), "local_messages": 0, "remote_messages": 0, "terminated": True,
+             "reason": reason, "compute_s": compute}
+    for result in _results(results, workers):
+        stats["local_messages"] += result["local_messages"]
+        stats["remote_messages"] += result["remote_messages"]
+        if result["metrics"] is not None:
+            metrics.registry.merge(result["metrics"])
+        for id, parent, children, fragment, terminated, members in result["states"]:
+            nd_ = by_id[id]
+            nd_.parent, nd_.children, nd_.fragment, nd_.terminated = parent, set(children), fragment, terminated
+            stats["terminated"] &= terminated
+            for neigh in nd_.neighbours:
+                if neigh.node.id in members:
+                    neigh.edge.state = EdgeState.MEMBER
+
+    for w in workers:
+        w.join()
+    if link == "shm":
+        for ring in rings.values():
+            ring.close()
+    stats["teardown_s"] = time.perf_counter() - start
+    return stats
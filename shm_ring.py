@@ -0,0 +1,106 @@
+"""
+    Shared-memory ring : single-producer / single-consumer queue of fixed-size Message records between two processes
+"""
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+from items import MESSAGE_TYPES, Message
+
+# Record: destination id, then the fixed part of the message (type, job id, sender id, fragment id, level, weight) and
+# its params, at most MAX_PARAMS (the edge id of a REPORT)
+MAX_PARAMS = 1
+RECORD = struct.Struct("<IBIIIIqB" + "q" * MAX_PARAMS)
+NO_PARAMS = (0,) * MAX_PARAMS
+SLOT_SIZE = 48
+# Header: head (next slot to read, written by the consumer only) and tail (next slot to write, written by the producer
+# only), each on its own cache line
+INDEX = struct.Struct("<Q")
+HEAD = 0
+TAIL = 64
+DATA = 128
+
+SPIN = 200  # Polls before the waiting side starts to sleep. Between polls it yields the CPU, the other side may need it
+MAX_SLEEP = 0.001
+
+
+class ShmRing:
+    # Lock-free: each index has a single writer, and a slot is only published (tail moved) once it is written
+    def __init__(self, name: Optional[str] = None, capacity: int = 4096):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=DATA + capacity * SLOT_SIZE)
+            self.shm.buf[:DATA] = bytes(DATA)
+            self.owner = True
+        else:
+            # Attached from a child process: it shares the resource tracker of the creator, which stays the only one
+            # to unlink the segment
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        self.capacity = (len(self.buf) - DATA) // SLOT_SIZE
+
+    def _index(self, offset: int) -> int:
+        return INDEX.unpack_from(self.buf, offset)[0]
+
+    def put(self, dst_id: int, message: Message):
+        # Producer side. Wait while the ring is full
+        param = message.param
+        if len(param) > MAX_PARAMS:
+            raise ValueError("records have room for {} params".format(MAX_PARAMS))
+        tail = self._index(TAIL)
+        wait = 0
+        while tail - self._index(HEAD) >= self.capacity:
+            wait = _backoff(wait)
+
+        RECORD.pack_into(self.buf, DATA + (tail % self.capacity) * SLOT_SIZE, dst_id, message.message_type.value,
+                         message.job, message.sender, message.fragment, message.level, message.weight, len(param),
+                         *(tuple(param) + NO_PARAMS[len(param):]))
+        INDEX.pack_into(self.buf, TAIL, tail + 1)
+
+    def get_all(self) -> List[Tuple[int, Message]]:
+        # Consumer side. Return every (destination id, message) published so far, without waiting
+        head = self._index(HEAD)
+        tail = self._index(TAIL)
+        received = []
+        for i in range(head, tail):
+            dst_id, message_type, job, sender, fragment, level, weight, nb_param, *params = RECORD.unpack_from(
+                self.buf, DATA + (i % self.capacity) * SLOT_SIZE)
+            message = Message(MESSAGE_TYPES[message_type], params[:nb_param], weight)
+            message.job = job
+            message.sender = sender
+            message.fragment = fragment
+            message.level = level
+            received.append((dst_id, message))
+        if tail != head:
+            INDEX.pack_into(self.buf, HEAD, tail)
+        return received
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _backoff(wait: int) -> int:
+    # Spin first, then sleep longer and longer. Return the new number of waits
+    if wait >= SPIN:
+        time.sleep(min(MAX_SLEEP, 0.00001 * (wait - SPIN + 1)))
+    else:
+        os.sched_yield()
+    return wait + 1
+
+
+def wait_any(rings: List[ShmRing], stop=lambda: False) -> List[Tuple[int, Message]]:
+    # Consumer side. Wait until at least one of the rings has records, or stop() is True
+    wait = 0
+    while True:
+        received = []
+        for ring in rings:
+            received += ring.get_all()
+        if received or stop():
+            return received
+        wait = _backoff(wait)
@@ -0,0 +1,105 @@
+"""
+    Round-based engine : synchronous rounds with a virtual clock, no thread and no socket
+
+In each round every node handles, in order, all the messages delivered to it at the end of the previous round. The
+messages sent during a round are only delivered at the end of it. The nodes are handled by increasing id, so a run
+only depends on the graph.
+"""
+import time
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import metrics
+import recorder
+import script
+from items import Message, MessageType, Node
+from transport import Transport
+from utils import make_init_node
+
+if TYPE_CHECKING:
+    from arrays import ArrayGraph
+
+
+class RoundTransport(Transport):
+    # The messages wait in the simulator until the end of the round
+    def __init__(self, simulator: "Simulator"):
+        self.simulator = simulator
+
+    def send(self, message: Message, node_dst: Node):
+        self.simulator.outgoing.append((node_dst.id, message.sender, message))
+
+
+class Simulator:
+    # With the ArrayGraph the nodes were built from, the number of edges in each state is recorded after every round
+    def __init__(self, nodes: List[Node], graph: Optional["ArrayGraph"] = None):
+        self.nodes = sorted(nodes, key=lambda nd_: nd_.id)
+        self.graph = graph
+        self.init_node = make_init_node(self.nodes)
+        self.outgoing: List[Tuple[int, int, Message]] = []  # (destination id, sender id, message) sent this round
+        for nd_ in self.nodes + [self.init_node]:
+            nd_.transport = RoundTransport(self)
+
+        # Per round: messages delivered at its start, messages handled (the others were for terminated nodes) and
+        # time to handle them
+        self.messages_per_round: List[int] = []
+        self.work_per_round: List[int] = []
+        self.time_per_round: List[float] = []
+        self.states_per_round: List[Dict[str, int]] = []
+
+    def run(self, max_rounds: Optional[int] = None) -> bool:
+        # Run until no message is in flight or max_rounds. Return True if all the nodes terminated
+        script.nodes_by_id = {nd_.id: nd_ for nd_ in self.nodes + [self.init_node]}
+        if metrics.registry is not None:
+            metrics.registry.instrument(self.nodes)
+        if recorder.recorder is not None:
+            recorder.recorder.instrument(self.nodes + [self.init_node])
+        dispatch = recorder.dispatcher(metrics.dispatcher(script.handle))
+
+        for nd_ in self.nodes:
+            self.init_node.send(Message(MessageType.INIT, []), nd_)
+
+        while self.outgoing and (max_rounds is None or len(self.messages_per_round) < max_rounds):
+            delivered, self.outgoing = self.outgoing, []
+            inboxes: Dict[int, List[Tuple[int, Message]]] = {}
+            for dst_id, sender_id, message in delivered:
+                inboxes.setdefault(dst_id, []).append((sender_id, message))
+
+            start = time.perf_counter()
+            work = 0
+            for dst_id in sorted(inboxes):
+                node = script.nodes_by_id[dst_id]
+                for sender_id, message in inboxes[dst_id]:
+                    if node.terminated:
+                        break
+                    dispatch(node, script.nodes_by_id[sender_id], message)
+                    work += 1
+                    if node.terminated:
+                        script.terminate_children(node)
+
+            self.messages_per_round.append(len(delivered))
+            self.work_per_round.append(work)
+            self.time_per_round.append(time.perf_counter() - start)
+            if self.graph is not None:
+                self.states_per_round.append(self.graph.count_states())
+
+        return all(nd_.terminated for nd_ in self.nodes)
+
+    def stats(self) -> dict:
+        return {
+            "rounds": len(self.messages_per_round),
+            "messages": sum(self.messages_per_round),
+            "handled": sum(self.work_per_round),
+            "in_flight": len(self.outgoing),
+            "max_messages_per_round": max(self.messages_per_round, default=0),
+            "messages_per_round": self.messages_per_round,
+            "work_per_round": self.work_per_round,
+            "time_per_round_s": self.time_per_round,
+            "states_per_round": self.states_per_round,
+        }
+
+
+def run(nodes: List[Node], max_rounds: Optional[int] = None,
+        graph: Optional["ArrayGraph"] = None) -> Tuple[bool, dict]:
+    # Return whether all the nodes terminated, and the statistics of the rounds
+    simulator = Simulator(nodes, graph)
+    terminated = simulator.run(max_rounds)
+    return terminated, simulator.stats()
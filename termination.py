@@ -0,0 +1,105 @@
+"""
+    Termination : when a run is over, and how long it takes to stop the nodes afterwards
+
+A run is over when one of these happens first:
+    - "terminated": every node terminated. The root of the last fragment finds no outgoing edge once the REPORTs of
+      its subtree came back, and the TERMINATE it sends down the tree reaches every node
+    - "quiescent": the protocol is stuck, as in simple_not_ending.txt. Every message sent has been handled and no
+      handler is running, so nothing can happen anymore. Detected by counting the messages
+    - "deadline": the deadline given to the engine is reached
+    - "failed": the run could not go on, e.g. a node could not bind its listener, its listener broke or a worker
+      process died
+
+Once it is over, the engine stops all its nodes at once, see script.run.
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from items import Message, Node
+from transport import Transport, TransportWrapper
+
+QUIESCENCE_INTERVAL = 0.005  # Time (s) between two readings of the counters
+
+
+class CountingTransport(TransportWrapper):
+    # Count the messages sent through another transport, for the Detector
+    def __init__(self, inner: Transport, detector: "Detector"):
+        super().__init__(inner)
+        self.detector = detector
+
+    def send(self, message: Message, node_dst: Node):
+        self.detector.sent[message.sender] += 1
+        self.inner.send(message, node_dst)
+
+
+class Detector:
+    # sent[id] and handled[id] are only written by the thread running node id, so they need no lock. The engines
+    # count a message as handled once its handler returned, also when it was dropped because the node had terminated
+    # Without quiescence, only "terminated" and "deadline": the messages of the nodes running elsewhere are not counted
+    def __init__(self, nb_nodes: int, interval: float = QUIESCENCE_INTERVAL, quiescence: bool = True):
+        self.nb_nodes = nb_nodes
+        self.interval = interval
+        self.quiescence = quiescence
+        self.sent: Dict[int, int] = {}
+        self.handled: Dict[int, int] = {}
+        self.nb_terminated = 0
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.reason: Optional[str] = None
+        self.snapshot: Optional[Tuple[int, int]] = None
+
+    def instrument(self, nodes: List[Node]):
+        # Count what the nodes send, the node starting the run included
+        for node in nodes:
+            self.sent[node.id] = 0
+            self.handled[node.id] = 0
+            node.transport = CountingTransport(node.transport, self)
+            # A node that can not receive anymore would leave its messages unhandled until the deadline
+            node.transport.on_failure(lambda: self.finish("failed"))
+
+    def node_terminated(self):
+        with self.lock:
+            self.nb_terminated += 1
+            if self.nb_terminated == self.nb_nodes:
+                self.finish("terminated")
+
+    def finish(self, reason: str):
+        if self.reason is None:
+            self.reason = reason
+            self.done.set()
+
+    def totals(self) -> Tuple[int, int, int]:
+        # Messages handled, messages sent and nodes terminated. handled first: a message is always counted as sent
+        # before it can be counted as handled
+        return sum(self.handled.values()), sum(self.sent.values()), self.nb_terminated
+
+    def poll(self, end: Optional[float]) -> bool:
+        # Return True once the run is over. The counters are read while the nodes run, but they only grow: if two
+        # readings in a row are the same, they all held these values at once between the two readings
+        if self.done.is_set():
+            return True
+        handled, sent, terminated = self.totals()
+        if terminated >= self.nb_nodes:
+            self.finish("terminated")
+        elif self.quiescence and handled == sent and (handled, sent) == self.snapshot:
+            self.finish("quiescent")
+        elif end is not None and time.perf_counter() >= end:
+            self.finish("deadline")
+        self.snapshot = (handled, sent)
+        return self.done.is_set()
+
+    def wait(self, deadline: Optional[float] = None) -> str:
+        # Block until the run is over, or deadline (s) from now. Return why it is over
+        end = None if deadline is None else time.perf_counter() + deadline
+        while not self.poll(end):
+            self.done.wait(self.interval)
+        return self.reason
+
+    async def wait_async(self, deadline: Optional[float] = None) -> str:
+        # Same as wait, from the event loop
+        end = None if deadline is None else time.perf_counter() + deadline
+        while not self.poll(end):
+            await asyncio.sleep(self.interval)
+        return self.reason
@@ -0,0 +1,47 @@
+import json
+import unittest
+import urllib.error
+import urllib.request
+
+import print_ts
+from daemon import Cluster, serve
+from transport import TcpTransport
+from utils import build_graph
+
+
+class TestApi(unittest.TestCase):
+    def setUp(self):
+        print_ts.configure(print_ts.WARNING)
+        self.cluster = Cluster(build_graph([(1, 2, 10), (1, 3, 1000)], TcpTransport))
+        self.server = serve(self.cluster, 0)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.cluster.close()
+
+    def post(self, body: bytes):
+        request = urllib.request.Request(self.url + "/jobs", data=body, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            return e.code, json.load(e)
+
+    def test_weight_not_an_integer(self):
+        for weights in ([[1, 2, 1.5]], [[1, 2, "5"]], [[1, 2, 1 << 63]], [[1.0, 2, 5]]):
+            code, body = self.post(json.dumps({"weights": weights}).encode())
+            self.assertEqual(code, 400, weights)
+            self.assertIn("error", body)
+
+    def test_body_not_an_object(self):
+        self.assertEqual(self.post(b"[1]")[0], 400)
+
+    def test_rejected_job_uses_no_id(self):
+        self.assertEqual(self.post(b'{"weights": [[1, 2, 1.5]]}')[0], 400)
+        self.assertEqual(self.post(b'{"weights": [[1, 2, 5]]}'), (201, {"id": 1}))
+
+
+if __name__ == "__main__":
+    unittest.main()
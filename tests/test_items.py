@@ -0,0 +1,35 @@
+import unittest
+
+from items import MAX_NODE_ID, Message, MessageType, edge_ends, edge_id
+from shm_ring import ShmRing
+from utils import build_graph
+
+
+class TestEdgeId(unittest.TestCase):
+    def test_round_trip_at_the_largest_ids(self):
+        for u, v in ((MAX_NODE_ID - 1, MAX_NODE_ID), (0, MAX_NODE_ID), (MAX_NODE_ID, 0)):
+            edge = edge_id(u, v)
+            self.assertEqual(edge_ends(edge), (min(u, v), max(u, v)))
+
+            message = Message(MessageType.REPORT, [edge], -5)
+            message.sender = MAX_NODE_ID + 1  # The INIT node
+            decoded = Message.decode(message.encode())
+            self.assertEqual((decoded.param, decoded.weight, decoded.sender), ([edge], -5, MAX_NODE_ID + 1))
+
+            ring = ShmRing(capacity=4)
+            try:
+                ring.put(u, message)
+                [(dst_id, received)] = ring.get_all()
+            finally:
+                ring.close()
+            self.assertEqual((dst_id, received.param), (u, [edge]))
+
+    def test_out_of_range_ids_rejected(self):
+        for edges in ([(MAX_NODE_ID, MAX_NODE_ID + 1, 1)], [(-1, 2, 1)]):
+            with self.assertRaises(ValueError):
+                build_graph(edges, None)
+        self.assertEqual(len(build_graph([(0, MAX_NODE_ID, 1)], None)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
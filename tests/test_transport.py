@@ -0,0 +1,73 @@
+import os
+import socket
+import struct
+import threading
+import unittest
+
+import print_ts
+from framing import encode_frame
+from items import Message, MessageType, Node
+from transport import HOST, TcpTransport, directory
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class TestTcpTransport(unittest.TestCase):
+    def setUp(self):
+        print_ts.configure(print_ts.WARNING)
+        self.node = Node(1, (HOST, 0), TcpTransport)
+        self.failed = threading.Event()
+        self.node.transport.on_failure(self.failed.set)
+        self.node.transport.start()
+
+    def tearDown(self):
+        self.node.transport.stop()
+        self.node.close()
+
+    def message(self) -> Message:
+        message = Message(MessageType.TEST, [7], 3)
+        message.sender = 2
+        return message
+
+    def test_send_to_itself(self):
+        message = self.message()
+        self.node.transport.send(message, self.node)
+        self.assertEqual(self.node.transport.inbox.get(timeout=1), (2, message))
+        self.assertEqual(self.node.transport.connections, {})
+
+    def test_reset_stream(self):
+        # A peer resetting its stream loses only that stream
+        reset = socket.create_connection(directory.lookup(self.node.id))
+        reset.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        reset.send(b"\0")
+        reset.close()
+
+        with socket.create_connection(directory.lookup(self.node.id)) as s:
+            s.sendall(encode_frame(self.message().encode()))
+            sender, message = self.node.transport.inbox.get(timeout=1)
+        self.assertEqual((sender, message.message_type, message.param), (2, MessageType.TEST, [7]))
+        self.assertFalse(self.failed.is_set())
+
+    @unittest.skipIf(resource is None, "needs resource.setrlimit")
+    def test_listener_error(self):
+        # No file descriptor left for accept: EMFILE
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        lowest_free = os.dup(0)
+        os.close(lowest_free)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (lowest_free, hard))
+        try:
+            client.connect(directory.lookup(self.node.id))
+            self.assertTrue(self.failed.wait(2))
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+            client.close()
+        self.node.transport.receiver.join(1)
+        self.assertFalse(self.node.transport.receiver.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,324 @@
+"""
+    Transports : how the messages of Node.send reach the inbox of the destination node
+"""
+import collections
+import queue
+import selectors
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from framing import FrameDecoder, encode_frame
+from items import Address, Message, Node
+from print_ts import ERROR, log
+
+HOST = "127.0.0.1"  # Default host of the nodes, they all share it and get their own port
+FLUSH_WINDOW = 0.001  # Messages queued for the same destination within this delay (s) are sent in one write
+CONNECT_RETRY = 5.0  # How long (s) to retry a refused connection: a node of another process may not listen yet
+
+
+class Directory:
+    # Where each node listens: id -> (host, port). Filled when the nodes are loaded, and updated with the port picked
+    # by the OS when a node listening on port 0 starts
+    def __init__(self):
+        self.addresses: Dict[int, Address] = {}
+        self.address_map: Dict[int, Address] = {}  # Loaded with load, wins over the addresses of the nodes
+
+    def load(self, path: str):
+        # Address map shared by all the hosts, one "id,host,port" line per node
+        with open(path) as file:
+            for line in file:
+                fields = line.strip().split(",")
+                if len(fields) == 3 and fields[0].isdigit():
+                    self.address_map[int(fields[0])] = (fields[1], int(fields[2]))
+
+    def register(self, id: int, address: Address):
+        self.addresses[id] = self.address_map.get(id, address)
+
+    def lookup(self, id: int) -> Address:
+        return self.addresses[id]
+
+    def split(self, nodes: List[Node], hosts: List[str]) -> Tuple[List[Node], List[Node]]:
+        # The nodes the address map puts on one of hosts, run by this process, and the others
+        local = [n for n in nodes if self.address_map.get(n.id, (HOST, 0))[0] in hosts]
+        remote = [n for n in nodes if self.address_map.get(n.id, (HOST, 0))[0] not in hosts]
+        return local, remote
+
+
+directory = Directory()
+
+
+class Transport:
+    # Interface used by Node.send / Node.receive and by the engines
+    inbox: queue.Queue  # (sender id, message) received, waiting to be handled by the node
+
+    def send(self, message: Message, node_dst: Node):
+        raise NotImplementedError
+
+    def receive(self) -> Optional[Tuple[int, Message]]:
+        # Wait for the next message. Return None if interrupted
+        raise NotImplementedError
+
+    def interrupt(self):
+        # Wake up the thread blocked in receive()
+        pass
+
+    def start(self):
+        # Start filling the inbox
+        pass
+
+    def stop(self):
+        # Stop filling the inbox, right away
+        pass
+
+    def close(self):
+        # Release everything held by the transport
+        pass
+
+    def on_failure(self, failed: Callable[[], None]):
+        # Call failed if the transport stops filling the inbox before stop, e.g. its listener broke
+        pass
+
+
+class TransportWrapper(Transport):
+    # Forward everything to another transport and share its inbox. The instrumentation (termination, metrics,
+    # recorder, benchmarks) subclasses it and only overrides send
+    def __init__(self, inner: Transport):
+        self.inner = inner
+        if hasattr(inner, "inbox"):
+            self.inbox = inner.inbox
+
+    def send(self, message: Message, node_dst: Node):
+        self.inner.send(message, node_dst)
+
+    def receive(self):
+        return self.inner.receive()
+
+    def interrupt(self):
+        self.inner.interrupt()
+
+    def start(self):
+        self.inner.start()
+
+    def stop(self):
+        self.inner.stop()
+
+    def close(self):
+        self.inner.close()
+
+    def on_failure(self, failed: Callable[[], None]):
+        self.inner.on_failure(failed)
+
+
+# TCP backend: one listener per node and one persistent stream per destination. Addresses come from directory
+class TcpTransport(Transport):
+    def __init__(self, node: Node):
+        self.node = node
+        self.inbox = queue.Queue()
+        directory.register(node.id, node.address)
+
+        # The listener is only bound when the node starts, see listen
+        self.s: Optional[socket.socket] = None
+        self.selector: Optional[selectors.BaseSelector] = None  # Multiplex the listener and all the incoming streams
+        # A byte written on waker_w interrupts receive()
+        self.waker: Optional[socket.socket] = None
+        self.waker_w: Optional[socket.socket] = None
+
+        self.connections: Dict[int, socket.socket] = {}  # Outgoing stream to each destination, opened on first send
+        self.pending = collections.deque()  # Messages already decoded but not yet returned by receive()
+        self.decoders: Dict[socket.socket, FrameDecoder] = {}  # Frames being rebuilt on each incoming stream
+
+        # Coalesce the outgoing frames, a background thread started on the first send writes them every
+        # FLUSH_WINDOW
+        self.outbox: Dict[int, Tuple[Node, bytearray]] = {}
+        self.outbox_ready = threading.Condition()
+        self.flusher: Optional[threading.Thread] = None
+        self.closed = False
+
+        self.receiver: Optional[threading.Thread] = None
+        self.kill = threading.Event()
+        self.failed: Optional[Callable[[], None]] = None  # See on_failure
+
+    def listen(self):
+        self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.s.bind(directory.lookup(self.node.id))
+        self.s.listen()
+        # The port is known only now if the OS picked it
+        directory.register(self.node.id, self.s.getsockname())
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.s, selectors.EVENT_READ)
+        self.waker, self.waker_w = socket.socketpair()
+        self.selector.register(self.waker, selectors.EVENT_READ)
+
+    def _connection(self, node_dst: Node) -> socket.socket:
+        # Return the stream to node_dst, open it the first time
+        s = self.connections.get(node_dst.id)
+        if s is None:
+            # Any source port, the stream stays open for all the next messages
+            end = time.perf_counter() + CONNECT_RETRY
+            while s is None:
+                try:
+                    s = socket.create_connection(directory.lookup(node_dst.id))
+                except ConnectionRefusedError:
+                    if time.perf_counter() >= end:
+                        raise
+                    time.sleep(0.01)
+            self.connections[node_dst.id] = s
+        return s
+
+    def send(self, message: Message, node_dst: Node):
+        if node_dst.id == self.node.id:
+            # To itself, no stream
+            self.inbox.put((message.sender, message))
+            return
+        frame = encode_frame(message.encode())
+        with self.outbox_ready:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self.flusher.start()
+            if node_dst.id in self.outbox:
+                self.outbox[node_dst.id][1].extend(frame)
+            else:
+                self.outbox[node_dst.id] = (node_dst, bytearray(frame))
+            self.outbox_ready.notify()
+
+    def _flush_loop(self):
+        while True:
+            with self.outbox_ready:
+                while not self.outbox and not self.closed:
+                    self.outbox_ready.wait()
+                if self.closed:
+                    return
+            # Let the other messages of the same burst join the outbox
+            time.sleep(FLUSH_WINDOW)
+            self.flush()
+
+    def flush(self):
+        # Write everything queued, one write per destination
+        with self.outbox_ready:
+            outbox, self.outbox = self.outbox, {}
+        for node_dst, data in outbox.values():
+            try:
+                self._connection(node_dst).sendall(data)
+            except OSError:
+                log(ERROR, "transport", "EXEPTION !!!! {} can not reach {}", self.node.id, node_dst.id)
+
+    def receive(self):
+        # Wait until at least one message is available on one of the streams. Return None if interrupted
+        while not self.pending:
+            for key, _ in self.selector.select():
+                if key.fileobj is self.s:
+                    # New incoming stream
+                    try:
+                        clientsocket, _ = self.s.accept()
+                    except OSError as e:
+                        # E.g. EMFILE, too many open files: no other node can reach this one anymore
+                        log(ERROR, "transport", "Node {} stops listening: {}", self.node.id, e)
+                        self.selector.unregister(self.s)
+                        self.kill.set()
+                        if self.failed is not None:
+                            self.failed()
+                        return None
+                    self.selector.register(clientsocket, selectors.EVENT_READ)
+                elif key.fileobj is self.waker:
+                    self.waker.recv(64)
+                    return None
+                else:
+                    self._read(key.fileobj)
+
+        return self.pending.popleft()
+
+    def _read(self, clientsocket: socket.socket):
+        try:
+            data = clientsocket.recv(65536)
+        except OSError as e:
+            # E.g. ECONNRESET, only this stream is lost
+            log(ERROR, "transport", "Node {} lost an incoming stream: {}", self.node.id, e)
+            data = b""
+        if not data:
+            # The sender closed the stream
+            self.selector.unregister(clientsocket)
+            self.decoders.pop(clientsocket, None)
+            clientsocket.close()
+            return
+
+        # A read may hold several messages, or only a part of one
+        decoder = self.decoders.setdefault(clientsocket, FrameDecoder())
+        for frame in decoder.feed(data):
+            # The sender id is carried by the message itself
+            message = Message.decode(frame)
+            self.pending.append((message.sender, message))
+
+    def interrupt(self):
+        if self.waker_w is not None:
+            self.waker_w.send(b"\0")
+
+    def on_failure(self, failed: Callable[[], None]):
+        self.failed = failed
+
+    def _receive_loop(self):
+        # Listen to the sockets and store the messages in the inbox, until stop or a listener error
+        while not self.kill.is_set():
+            received = self.receive()
+            # None when interrupted by stop
+            if received is not None:
+                self.inbox.put(received)
+
+    def start(self):
+        self.listen()
+        self.receiver = threading.Thread(target=self._receive_loop)
+        self.receiver.start()
+
+    def stop(self):
+        self.kill.set()
+        self.interrupt()
+        if self.receiver is not None:
+            self.receiver.join()
+
+    def close(self):
+        # Send what is still queued, then close the outgoing streams, the incoming ones and the listener
+        self.flush()
+        with self.outbox_ready:
+            self.closed = True
+            self.outbox_ready.notify()
+        for s in self.connections.values():
+            s.close()
+        self.connections.clear()
+        if self.selector is not None:
+            for key in list(self.selector.get_map().values()):
+                key.fileobj.close()
+            self.selector.close()
+            self.waker_w.close()
+        if self.s is not None:
+            # Not in the selector if it could not bind or broke, see receive
+            self.s.close()
+
+
+class InMemoryNetwork:
+    # All the nodes of one process, messages are handed over without serialization
+    def __init__(self):
+        self.inboxes: Dict[int, queue.Queue] = {}
+
+    def transport(self, node: Node) -> "InMemoryTransport":
+        # Use as transport factory, e.g. read_files(paths, transport=network.transport)
+        return InMemoryTransport(node, self)
+
+
+# In-memory backend: the message object goes straight into the inbox of the destination
+class InMemoryTransport(Transport):
+    def __init__(self, node: Node, network: InMemoryNetwork):
+        self.network = network
+        self.inbox = queue.Queue()
+        network.inboxes[node.id] = self.inbox
+
+    def send(self, message: Message, node_dst: Node):
+        self.network.inboxes[node_dst.id].put((message.sender, message))
+
+    def receive(self):
+        return self.inbox.get()
+
+    def interrupt(self):
+        self.inbox.put(None)
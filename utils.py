@@ -1,23 +1,29 @@
+import glob
+import os
 from typing import Optional, List
 
 import yaml
 
-from items import Edge, Node, Neighbour
+from items import Edge, Node, Neighbour, check_node_id
+from transport import HOST, TcpTransport
 import threading  # :(
 from threading import Lock
 
+# The C loader is much faster when libyaml is available
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 # visualgo.net
 # {"vl":{"0":{"x":100,"y":40},"1":{"x":200,"y":220},"2":{"x":280,"y":40},"3":{"x":420,"y":240},"4":{"x":480,"y":60},"5":{"x":560,"y":260},"6":{"x":640,"y":60},"7":{"x":760,"y":240}},"el":{"0":{"u":0,"v":1,"w":3},"1":{"u":0,"v":2,"w":2},"2":{"u":1,"v":2,"w":2},"3":{"u":1,"v":3,"w":3},"4":{"u":1,"v":4,"w":4},"5":{"u":2,"v":5,"w":4},"6":{"u":4,"v":5,"w":3},"7":{"u":4,"v":6,"w":2},"8":{"u":4,"v":7,"w":4},"9":{"u":5,"v":7,"w":3},"10":{"u":6,"v":7,"w":3}}}
 
-def read_files(all_files_path):
+def read_files(all_files_path, transport=TcpTransport):
     # Read content of all files and return data contained inside each file
     data = []
     for f in all_files_path:
         try:
             # Open and read file
             with open(f) as file:
-                yaml_node = yaml.load(file, Loader=yaml.FullLoader)
+                yaml_node = yaml.load(file, Loader=YAML_LOADER)
                 data.append(yaml_node)
 
             # Close file
@@ -27,14 +33,14 @@ def read_files(all_files_path):
             exit()
 
     # Create all nodes, without neighbours. Return all nodes
-    nodes = []
+    nodes_by_id = {}
     for n in data:
-        nodes.append(Node(n['id'], n['address']))
+        nodes_by_id[n['id']] = Node(check_node_id(n['id']), (n.get('address', HOST), n.get('port', 0)), transport)
 
     # Add all neighbours
     all_edge = {}
-    for n in nodes:
-        yaml_node = next(filter(lambda x: x["id"] == n.id, data))
+    for yaml_node in data:
+        n = nodes_by_id[yaml_node["id"]]
         edges = []
         for neighbour in yaml_node["neighbours"]:
             key = (min([n.id, neighbour["id"]]), max([n.id, neighbour["id"]]))
@@ -43,15 +49,94 @@ def read_files(all_files_path):
                 e = Edge(weight=neighbour["edge_weight"])
                 all_edge[key] = e
 
-            edges.append(Neighbour(edge=all_edge[key], node=next(filter(lambda x: x.id == neighbour["id"], nodes))))
+            edges.append(Neighbour(edge=all_edge[key], node=nodes_by_id[neighbour["id"]]))
+
+        init_neighbours(n, edges)
+
+    return list(nodes_by_id.values())
+
+
+# Read a list of edges (u, v, weight): a (E, 3) array for .npy files, a list of triplets otherwise
+def read_edges(path):
+    if path.endswith(".npy"):
+        # Memory-mapped, so that only the rows are materialized
+        import numpy as np
+
+        return np.load(path, mmap_mode="r")
+
+    # One edge per line, "u,v,w" (.csv) or "u<TAB>v<TAB>w" (.tsv). Empty lines, comments and header are skipped
+    sep = "\t" if path.endswith(".tsv") else ","
+    edges = []
+    with open(path) as file:
+        for line in file:
+            fields = line.strip().split(sep)
+            if len(fields) < 3 or not fields[0].strip().isdigit():
+                continue
+            edges.append((int(fields[0]), int(fields[1]), int(fields[2])))
+    return edges
+
+
+# Read a graph given as a list of edges (u, v, weight). Return all nodes
+def read_edge_list(path, transport=TcpTransport):
+    edges = read_edges(path)
+    if not isinstance(edges, list):
+        edges = _rows(edges)
+    return build_graph(edges, transport)
+
+
+# The rows of a memory-mapped array as lists, a chunk at a time, so that the file is never loaded at once
+def _rows(array, chunk: int = 1 << 16):
+    for start in range(0, len(array), chunk):
+        yield from array[start:start + chunk].tolist()
 
-        n.neighbours = edges
-        n.to_mwoe = n
-        n.accepted = n.neighbours.copy()
-        n.barrier = len(edges)
-        n.count = len(edges)
 
-    return nodes
+# The dummy node sending INIT to all the others to begin the algorithm. Its id is none of the graph, which may
+# have a node 0 (edge lists are often 0-based)
+def make_init_node(nodes: List[Node], transport=None) -> Node:
+    return Node(max((n.id for n in nodes), default=0) + 1, (HOST, 0), transport)
+
+
+# Build nodes from (u, v, weight) triplets, in O(E). All the nodes listen on HOST, on a port picked by the OS
+def build_graph(edges, transport=TcpTransport):
+    nodes_by_id = {}
+    neighbours = {}
+    all_edge = set()
+    for u, v, w in edges:
+        u, v = int(u), int(v)
+        key = (min(u, v), max(u, v))
+        if key in all_edge or u == v:
+            continue
+        all_edge.add(key)
+
+        for x in key:
+            if x not in nodes_by_id:
+                nodes_by_id[x] = Node(check_node_id(x), (HOST, 0), transport)
+                neighbours[x] = []
+
+        e = Edge(weight=int(w))
+        neighbours[u].append(Neighbour(edge=e, node=nodes_by_id[v]))
+        neighbours[v].append(Neighbour(edge=e, node=nodes_by_id[u]))
+
+    for x, n in nodes_by_id.items():
+        init_neighbours(n, neighbours[x])
+
+    return list(nodes_by_id.values())
+
+
+# Read a graph from a directory of node-*.yaml files or from an edge list file
+def read_graph(path, transport=TcpTransport):
+    if os.path.isdir(path):
+        all_files_path = sorted(glob.glob(os.path.join(path, "node-*.yaml")),
+                                key=lambda f: int(os.path.basename(f)[len("node-"):-len(".yaml")]))
+        return read_files(all_files_path, transport)
+    return read_edge_list(path, transport)
+
+
+# Set the neighbours of a node, lightest edge first, and the initial state of the algorithm depending on them
+def init_neighbours(n: Node, edges: List[Neighbour]):
+    n.set_neighbours(sorted(edges, key=lambda neigh: neigh.edge.weight))
+    n.accepted = n.neighbours.copy()
+    n.count = len(edges)
 
 
 # Find the least weighted neighbour
@@ -66,25 +151,17 @@ def find_least_weighted_neighbour(neighbours: List[Neighbour]):
 
 # Get the neighbour of the parent
 def get_neighbour_of_parent(node: Node) -> Optional[Neighbour]:
-    for neigh in node.neighbours:
-        if neigh.node.parent == node.parent:
-            return neigh
-
-    return None
+    return node.neighbour_by_id.get(node.parent)
 
 
-# Get the neighbour corresponding to a node
-def neighbour_from_node(node: Node, neighbors: List[Neighbour]) -> Neighbour:
-    for neigh in neighbors:
-        if neigh.node.id == node.id:
-            return neigh
+# Get the neighbour of node corresponding to another node
+def neighbour_from_node(other: Node, node: Node) -> Optional[Neighbour]:
+    return node.neighbour_by_id.get(other.id)
 
 
-# Get the neighbour corresponding to an id
-def neighbour_from_id(id: int, neighbors: List[Neighbour]) -> Neighbour:
-    for neigh in neighbors:
-        if neigh.node.id == id:
-            return neigh
+# Get the neighbour of node corresponding to an id
+def neighbour_from_id(id: int, node: Node) -> Optional[Neighbour]:
+    return node.neighbour_by_id.get(id)
 
 
 class bcolors: